@@ -26,9 +26,18 @@
 #define PIN 6
 
 // 604 bytes = 150 pixels + 4 control bytes.
+// With packed pixels, the same buffer holds 198 pixels + 5 control bytes.
 #define PACKET_MAX_SIZE 600
 
-Adafruit_NeoPixel strip = Adafruit_NeoPixel(150, PIN, NEO_GRB + NEO_KHZ800);
+// The number of pixels on the strip. Strips longer than a packet can
+// hold are sent as several fragment packets, so this can be raised
+// without raising PACKET_MAX_SIZE.
+#define STRIP_PIXELS 150
+
+// The only version of the packed pixel format so far: red, green, blue bytes.
+#define PACKED_VERSION 1
+
+Adafruit_NeoPixel strip = Adafruit_NeoPixel(STRIP_PIXELS, PIN, NEO_GRB + NEO_KHZ800);
 
 // Ethernet variables. Change for your environment.
 byte mac[] = { 0xDE, 0xAD, 0xBE, 0xEF, 0xFE, 0xED };
@@ -40,6 +49,11 @@ EthernetUDP Udp;
 // Internal state variables.
 char input = 0;
 
+// The fragmented frame currently being received.
+uint8_t frameSequence = 0;
+uint16_t frameReceived = 0;
+bool framePending = false;
+
 void setup() {
   // Initialize all pixels to 'off'
   strip.begin();
@@ -57,7 +71,7 @@ void setup() {
 void loop() {
   int packetSize = Udp.parsePacket();
   if (packetSize) {
-    Udp.read(packetBuffer, PACKET_MAX_SIZE);
+    int dataSize = Udp.read(packetBuffer, PACKET_MAX_SIZE);
 
    if (packetBuffer[0] == 'I') {
      // Input selection command. Change input,
@@ -94,5 +108,116 @@ void loop() {
        strip.show();
      }
    }
+   if (packetBuffer[0] == 'R') {
+     // Packed pixel data. If it's not for the current input,
+     // or it's a format we don't know, don't process it.
+     // Byte 0: 'R'
+     // Byte 1: single byte, input number.
+     // Byte 2: single byte, format version.
+     // Byte 3-4: uint16_t, number of pixels.
+     // Byte 5+: pixel data, three bytes each, red, green, blue.
+     if (packetBuffer[1] == input && packetBuffer[2] == PACKED_VERSION) {
+       uint16_t pixelCount = *((uint16_t*) &packetBuffer[3]);
+       uint8_t *pixelColour = (uint8_t*) &packetBuffer[5];
+
+       for (uint16_t i = 0; i < pixelCount; i++) {
+         // Prevent internal memory buffer overrun.
+         if ((5 + (i * 3) + 3) <= dataSize) {
+           strip.setPixelColor(i, pixelColour[0], pixelColour[1], pixelColour[2]);
+           pixelColour += 3;
+         }
+       }
+       strip.show();
+     }
+   }
+   if (packetBuffer[0] == 'F') {
+     // Part of a frame too big for one packet. If it's not for
+     // the current input, don't process it.
+     // Byte 0: 'F'
+     // Byte 1: single byte, input number.
+     // Byte 2: single byte, frame sequence number.
+     // Byte 3: single byte, bytes per pixel. 4 for uint32_t words,
+     //         3 for red, green, blue bytes.
+     // Byte 4-5: uint16_t, number of pixels in the whole frame.
+     // Byte 6-7: uint16_t, first pixel in this packet.
+     // Byte 8-9: uint16_t, number of pixels in this packet.
+     // Byte 10+: pixel data.
+     if (packetBuffer[1] == input) {
+       uint8_t sequence = packetBuffer[2];
+       uint8_t bytesPerPixel = packetBuffer[3];
+       uint16_t frameSize = *((uint16_t*) &packetBuffer[4]);
+       uint16_t firstPixel = *((uint16_t*) &packetBuffer[6]);
+       uint16_t pixelCount = *((uint16_t*) &packetBuffer[8]);
+
+       if (sequence != frameSequence) {
+         // A newer frame has started. Show whatever arrived of the
+         // last one, rather than waiting for pieces that got lost.
+         if (framePending) {
+           strip.show();
+         }
+         frameSequence = sequence;
+         frameReceived = 0;
+         framePending = false;
+       }
+
+       if (bytesPerPixel == 3 || bytesPerPixel == 4) {
+         int offset = 10;
+         for (uint16_t i = 0; i < pixelCount; i++) {
+           // Prevent internal memory buffer overrun.
+           if ((offset + bytesPerPixel) > dataSize) {
+             break;
+           }
+           if (bytesPerPixel == 4) {
+             strip.setPixelColor(firstPixel + i, *((uint32_t*) &packetBuffer[offset]));
+           } else {
+             strip.setPixelColor(firstPixel + i, packetBuffer[offset], packetBuffer[offset + 1], packetBuffer[offset + 2]);
+           }
+           offset += bytesPerPixel;
+           frameReceived++;
+           framePending = true;
+         }
+       }
+
+       // Latch the frame as soon as it's complete.
+       if (framePending && frameReceived >= frameSize) {
+         strip.show();
+         framePending = false;
+       }
+     }
+   }
+   if (packetBuffer[0] == 'D') {
+     // Changed pixels only. If it's not for the current input,
+     // don't process it.
+     // Byte 0: 'D'
+     // Byte 1: single byte, input number.
+     // Byte 2: single byte, number of runs.
+     // Byte 3+: the runs, each of which is:
+     //   uint16_t, first pixel.
+     //   single byte, number of pixels.
+     //   pixel data.
+     if (packetBuffer[1] == input) {
+       uint8_t runCount = packetBuffer[2];
+       int offset = 3;
+
+       for (uint8_t run = 0; run < runCount; run++) {
+         // Prevent internal memory buffer overrun.
+         if ((offset + 3) > dataSize) {
+           break;
+         }
+         uint16_t firstPixel = *((uint16_t*) &packetBuffer[offset]);
+         uint8_t runLength = packetBuffer[offset + 2];
+         offset += 3;
+
+         for (uint8_t i = 0; i < runLength; i++) {
+           if ((offset + 4) > dataSize) {
+             break;
+           }
+           strip.setPixelColor(firstPixel + i, *((uint32_t*) &packetBuffer[offset]));
+           offset += 4;
+         }
+       }
+       strip.show();
+     }
+   }
   }
 }
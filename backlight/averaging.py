@@ -0,0 +1,64 @@
+# Averages the downscaled frames over time, to stop the LEDs flickering.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy
+
+class FrameAverager(object):
+	"""
+	Averages the last N downscaled frames. The frames are kept in a ring
+	buffer alongside a running sum, so each new frame costs one subtract
+	and one add no matter how many frames are being averaged.
+	"""
+
+	def __init__(self, width, height, frames, channels = 3):
+		self.frames = frames
+		self.history = numpy.zeros((frames, height, width, channels), dtype = numpy.uint8)
+
+		# A uint16 sum can hold 257 frames of 255 before it overflows.
+		if frames <= 257:
+			sum_type = numpy.uint16
+		else:
+			sum_type = numpy.uint32
+		self.total = numpy.zeros((height, width, channels), dtype = sum_type)
+
+		# Reused for the result of each frame.
+		self.average = numpy.zeros((height, width, channels), dtype = numpy.uint8)
+
+		self.index = 0
+		self.count = 0
+
+	def push(self, frame):
+		"""
+		Add a (height, width, channels) frame, dropping the oldest one,
+		and return the average. The returned array is reused by the next
+		call, so copy it if you need to keep it.
+		"""
+		slot = self.history[self.index]
+		self.total -= slot
+		slot[...] = frame
+		self.total += slot
+
+		# Wrap the buffer number around, if needed.
+		self.index += 1
+		if self.index >= self.frames:
+			self.index = 0
+
+		# Until the buffer fills, only average the frames we've seen.
+		if self.count < self.frames:
+			self.count += 1
+
+		numpy.floor_divide(self.total, self.count, out = self.average, casting = 'unsafe')
+		return self.average
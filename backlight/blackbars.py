@@ -0,0 +1,142 @@
+# Finds the black bars around the picture, and tracks them over a sliding
+# window of frames.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+from collections import deque
+
+import numpy
+
+# How much red, green and blue each count towards how bright a pixel looks
+# (BT.601), out of 256.
+LUMA_WEIGHTS = numpy.array([77, 150, 29], dtype = numpy.uint16)
+
+class SlidingExtreme(object):
+	"""
+	Keeps the minimum (or maximum) of the values seen over a sliding
+	window, which is either a number of values or a number of seconds.
+	The window is a monotonic deque, so each new value costs amortised
+	O(1) however long the window is.
+	"""
+
+	def __init__(self, maximum = False, length = None, seconds = None):
+		self.maximum = maximum
+		self.length = length
+		self.seconds = seconds
+
+		# Entries are (sequence, timestamp, value), and the values only ever
+		# get worse towards the back, so the front is always the answer.
+		self.window = deque()
+		self.sequence = 0
+
+	def push(self, value, now = None):
+		"""
+		Add a value, and return the extreme over the window.
+		"""
+		if now is None:
+			now = time.time()
+
+		# Anything behind us that this value beats can never be the answer again.
+		if self.maximum:
+			while self.window and self.window[-1][2] <= value:
+				self.window.pop()
+		else:
+			while self.window and self.window[-1][2] >= value:
+				self.window.pop()
+
+		self.window.append((self.sequence, now, value))
+		self.sequence += 1
+
+		# Drop whatever has fallen out of the window. The value we've just
+		# added always stays.
+		if self.seconds is not None:
+			while self.window[0][1] < now - self.seconds:
+				self.window.popleft()
+		elif self.length is not None:
+			while self.window[0][0] < self.sequence - self.length:
+				self.window.popleft()
+
+		return self.window[0][2]
+
+class BlackBarDetector(object):
+	"""
+	Finds the black bars around the picture in a (height, width, 3)
+	frame: letterboxing at the top and bottom, pillarboxing at the left
+	and right, or both. A row or column is part of a bar if none of its
+	pixels is brighter than the threshold, as bars in compressed video
+	are rarely quite black. Only the search_height rows and search_width
+	columns in from each edge are considered.
+	"""
+
+	def __init__(self, width, height, search_height, search_width, threshold):
+		self.width = width
+		self.height = height
+		self.search_height = min(search_height, height)
+		self.search_width = min(search_width, width)
+		self.threshold = threshold
+
+	def first_bright(self, bright, search):
+		"""
+		Return how many of the first search values of bright are False
+		before the first True one.
+		"""
+		found = bright[:search]
+		if found.any():
+			return int(found.argmax())
+		return search
+
+	def detect(self, pixel_array):
+		"""
+		Return the (top, bottom, left, right) of the picture inside the
+		bars: the first and last rows and columns that aren't black.
+		"""
+		luma = numpy.dot(pixel_array[:, :, :3], LUMA_WEIGHTS) >> 8
+		rows = luma.max(axis = 1) > self.threshold
+		columns = luma.max(axis = 0) > self.threshold
+
+		return (
+			self.first_bright(rows, self.search_height),
+			self.height - 1 - self.first_bright(rows[::-1], self.search_height),
+			self.first_bright(columns, self.search_width),
+			self.width - 1 - self.first_bright(columns[::-1], self.search_width),
+		)
+
+class BlackBarTracker(object):
+	"""
+	Keeps the smallest top and left, and the largest bottom and right,
+	of the picture detected over the window, so the bars have to be there
+	for the whole window before the edges move in to them.
+	"""
+
+	def __init__(self, length = None, seconds = None):
+		self.top = SlidingExtreme(False, length, seconds)
+		self.bottom = SlidingExtreme(True, length, seconds)
+		self.left = SlidingExtreme(False, length, seconds)
+		self.right = SlidingExtreme(True, length, seconds)
+
+	def update(self, black_top, black_bottom, black_left, black_right, now = None):
+		"""
+		Add this frame's detected bars, and return the (top, bottom, left,
+		right) rows and columns to use.
+		"""
+		if now is None:
+			now = time.time()
+		return (
+			self.top.push(black_top, now),
+			self.bottom.push(black_bottom, now),
+			self.left.push(black_left, now),
+			self.right.push(black_right, now),
+		)
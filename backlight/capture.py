@@ -0,0 +1,379 @@
+# Captures the screen, and scales it down to the size of the LED grid.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import ctypes
+import time
+
+import numpy
+
+from backlight import xlib
+from backlight.sampling import SampleGrid
+from backlight.video import open_video
+
+class CaptureUnavailable(Exception):
+	pass
+
+class CaptureFinished(Exception):
+	"""
+	There is nothing more to capture, because the video has ended.
+	"""
+	pass
+
+def sample_grid(configuration, size):
+	"""
+	Set up the SampleGrid for a screen of the given (width, height).
+	"""
+	return SampleGrid(
+		size[0],
+		size[1],
+		configuration['size_x'],
+		configuration['size_y'],
+		configuration['zone_depth'],
+		configuration['zone_stride']
+	)
+
+def screen_region(configuration, screen_size):
+	"""
+	Return the (x, y) and (width, height) of the part of the screen to
+	capture: region in the configuration if it is set, or all of it.
+	"""
+	region = configuration['region']
+	if not region:
+		return (0, 0), tuple(screen_size)
+
+	x, y, width, height = region
+	if x < 0 or y < 0 or width <= 0 or height <= 0 or x + width > screen_size[0] or y + height > screen_size[1]:
+		raise ValueError("The region %s isn't inside the %d x %d screen." % (region, screen_size[0], screen_size[1]))
+	return (x, y), (width, height)
+
+class CaptureBackend(object):
+	"""
+	A way of capturing the screen. The capture script calls capture() and
+	then scale() each frame, and times them separately, so capture()
+	should do the grabbing and scale() everything after that.
+	"""
+
+	name = None
+
+	# The (x, y) on the screen and (width, height) of the part of the
+	# screen being captured.
+	origin = (0, 0)
+	size = (0, 0)
+
+	def capture(self):
+		raise NotImplementedError()
+
+	def scale(self):
+		"""
+		Return the last capture, scaled down to a (height, width, 3) array.
+		"""
+		raise NotImplementedError()
+
+	def close(self):
+		pass
+
+class GtkCapture(CaptureBackend):
+	"""
+	Captures the root window (or the region of it) with GTK, and scales
+	it down with nearest neighbour sampling.
+	"""
+
+	name = 'GTK'
+
+	def __init__(self, configuration):
+		import gtk.gdk
+		self.gdk = gtk.gdk
+
+		self.width = configuration['size_x']
+		self.height = configuration['size_y']
+		self.window = gtk.gdk.get_default_root_window()
+		self.origin, self.size = screen_region(configuration, self.window.get_size())
+
+		self.scale_x = float(self.width) / float(self.size[0])
+		self.scale_y = float(self.height) / float(self.size[1])
+		self.grid = sample_grid(configuration, self.size)
+
+		# Set up the buffers - only once, and we'll reuse them.
+		self.screen_contents = gtk.gdk.Pixbuf(gtk.gdk.COLORSPACE_RGB, False, 8, self.size[0], self.size[1])
+		self.scaled_contents = gtk.gdk.Pixbuf(gtk.gdk.COLORSPACE_RGB, False, 8, self.width, self.height)
+
+	def capture(self):
+		self.screen_contents = self.screen_contents.get_from_drawable(self.window, self.window.get_colormap(), self.origin[0], self.origin[1], 0, 0, self.size[0], self.size[1])
+
+	def scale(self):
+		# Averaging zones can't be done by GTK, so sample those ourselves.
+		if self.grid.depth > 1:
+			return self.grid.sample(self.screen_contents.pixel_array)
+		self.screen_contents.scale(self.scaled_contents, 0, 0, self.width, self.height, 0, 0, self.scale_x, self.scale_y, self.gdk.INTERP_NEAREST)
+		return self.scaled_contents.pixel_array
+
+class GtkEdgeCapture(CaptureBackend):
+	"""
+	Captures only the screen rows and columns that the edges and the black
+	bar search use, rather than the whole root window. That is a couple
+	of dozen lines of the screen instead of all of it, which makes a big
+	difference at high resolutions.
+	"""
+
+	name = 'GTK edges'
+
+	def __init__(self, configuration):
+		import gtk.gdk
+		self.gdk = gtk.gdk
+
+		self.width = configuration['size_x']
+		self.height = configuration['size_y']
+		self.window = gtk.gdk.get_default_root_window()
+		self.origin, self.size = screen_region(configuration, self.window.get_size())
+		self.grid = sample_grid(configuration, self.size)
+
+		# The black bar search looks this many rows and columns in from each
+		# edge, and the edges can move one further in than that.
+		rows = self.grid.band_rows(configuration['black_bar_search_height'] + 1)
+		columns = self.grid.band_columns(configuration['black_bar_search_width'] + 1)
+		self.row_samples = self.grid.sample_indexes(rows)
+		self.column_samples = self.grid.sample_indexes(columns)
+		self.screen_rows = self.grid.ys[self.row_samples]
+		self.screen_columns = self.grid.xs[self.column_samples]
+
+		# Set up the buffers - only once, and we'll reuse them. The rows are
+		# stacked into one Pixbuf, and the columns into another.
+		self.row_contents = gtk.gdk.Pixbuf(gtk.gdk.COLORSPACE_RGB, False, 8, self.size[0], len(self.screen_rows))
+		self.column_contents = gtk.gdk.Pixbuf(gtk.gdk.COLORSPACE_RGB, False, 8, len(self.screen_columns), self.size[1])
+		self.samples = numpy.zeros((len(self.grid.ys), len(self.grid.xs), 3), dtype = numpy.uint8)
+
+	def capture(self):
+		colormap = self.window.get_colormap()
+		left, top = self.origin
+		for i, y in enumerate(self.screen_rows.tolist()):
+			self.row_contents.get_from_drawable(self.window, colormap, left, top + y, 0, i, self.size[0], 1)
+		for i, x in enumerate(self.screen_columns.tolist()):
+			self.column_contents.get_from_drawable(self.window, colormap, left + x, top, i, 0, 1, self.size[1])
+
+	def scale(self):
+		# Only the bands that were captured are filled in.
+		rows = self.row_contents.pixel_array
+		columns = self.column_contents.pixel_array
+		self.samples[self.row_samples] = rows[:, self.grid.xs]
+		self.samples[:, self.column_samples] = columns[self.grid.ys]
+		return self.grid.reduce(self.samples)
+
+class XShmCapture(CaptureBackend):
+	"""
+	Captures the root window with the MIT-SHM extension, so the X server
+	writes the screen straight into shared memory instead of sending it
+	down the socket. The shared memory is viewed as a numpy array in
+	place, and sampled down to the LED grid from there.
+	"""
+
+	name = 'MIT-SHM'
+
+	def __init__(self, configuration):
+		self.width = configuration['size_x']
+		self.height = configuration['size_y']
+
+		# What we've set up so far, so close() can undo just that much.
+		self.image = None
+		self.shminfo = xlib.XShmSegmentInfo()
+		self.shminfo.shmid = -1
+		self.attached = False
+
+		self.display = None
+		try:
+			self.display = xlib.Display()
+			self.xext = xlib.xext()
+			self.libc = xlib.libc()
+		except xlib.XError, ex:
+			if self.display:
+				self.display.close()
+			raise CaptureUnavailable(str(ex))
+
+		try:
+			self.origin, self.size = screen_region(configuration, self.display.size)
+			self.attach()
+		except:
+			self.close()
+			raise
+
+		self.grid = sample_grid(configuration, self.size)
+
+	def attach(self):
+		display = self.display
+		if not self.xext.XShmQueryExtension(display.display):
+			raise CaptureUnavailable("the X server doesn't support MIT-SHM")
+
+		visual = display.x11.XDefaultVisual(display.display, display.screen)
+		depth = display.x11.XDefaultDepth(display.display, display.screen)
+		self.image = self.xext.XShmCreateImage(
+			display.display, visual, depth, xlib.ZPixmap, None,
+			ctypes.byref(self.shminfo), self.size[0], self.size[1])
+		if not self.image:
+			raise CaptureUnavailable("unable to create the shared image")
+
+		image = self.image.contents
+		if image.bits_per_pixel != 32:
+			raise CaptureUnavailable("%d bits per pixel isn't supported" % image.bits_per_pixel)
+
+		length = image.bytes_per_line * image.height
+		self.shminfo.shmid = self.libc.shmget(xlib.IPC_PRIVATE, length, xlib.IPC_CREAT | 0o600)
+		if self.shminfo.shmid < 0:
+			raise CaptureUnavailable("unable to allocate %d bytes of shared memory" % length)
+
+		address = self.libc.shmat(self.shminfo.shmid, None, 0)
+		if address is None or address == ctypes.c_void_p(-1).value:
+			raise CaptureUnavailable("unable to attach the shared memory")
+		self.shminfo.shmaddr = address
+		self.shminfo.readOnly = 0
+		image.data = address
+
+		# Fails for remote displays, which can't see our shared memory.
+		try:
+			display.trap_errors(self.xext.XShmAttach, display.display, ctypes.byref(self.shminfo))
+		except xlib.XError, ex:
+			raise CaptureUnavailable("the X server couldn't attach the shared memory (%s)" % ex)
+		self.attached = True
+
+		# Both sides are attached, so mark the segment to be freed once
+		# they detach, even if we exit without cleaning up.
+		self.release_segment()
+
+		# View the shared memory as the screen, without copying it. The
+		# pixels are B, G, R, X in memory, so the RGB view runs backwards.
+		buffer = (ctypes.c_ubyte * length).from_address(address)
+		rows = numpy.frombuffer(buffer, dtype = numpy.uint8).reshape(image.height, image.bytes_per_line)
+		self.pixels = rows[:, :image.width * 4].reshape(image.height, image.width, 4)[:, :, 2::-1]
+
+	def release_segment(self):
+		if self.shminfo.shmid >= 0:
+			self.libc.shmctl(self.shminfo.shmid, xlib.IPC_RMID, None)
+			self.shminfo.shmid = -1
+
+	def capture(self):
+		display = self.display
+		if not self.xext.XShmGetImage(display.display, display.root, self.image, self.origin[0], self.origin[1], xlib.AllPlanes):
+			raise CaptureUnavailable("XShmGetImage failed")
+
+	def scale(self):
+		return self.grid.sample(self.pixels)
+
+	def close(self):
+		display = self.display
+		if self.attached:
+			self.xext.XShmDetach(display.display, ctypes.byref(self.shminfo))
+			display.x11.XSync(display.display, 0)
+			self.attached = False
+		self.release_segment()
+		if self.shminfo.shmaddr:
+			self.libc.shmdt(self.shminfo.shmaddr)
+			self.shminfo.shmaddr = None
+		if self.image:
+			# The data is the shared memory, so free just the structure.
+			display.x11.XFree(self.image)
+			self.image = None
+		display.close()
+
+class FileCapture(CaptureBackend):
+	"""
+	Plays a video file instead of capturing the screen, so that
+	everything after the capture can run without a display, on real
+	pictures. Only the samples the SampleGrid wants are read from each
+	frame.
+
+	With a frame rate (video_fps, or the rate the file gives), frames are
+	played at that rate whatever the rest of the script is doing, waiting
+	for the next frame if we're ahead, and skipping frames if we're
+	behind. With a rate of 0, every frame is played, as fast as possible.
+	"""
+
+	name = 'file'
+
+	def __init__(self, configuration):
+		self.video = open_video(configuration['video_file'], configuration['video_size'])
+		self.origin, self.size = screen_region(configuration, self.video.size)
+		self.grid = sample_grid(configuration, self.size)
+
+		# Where the samples are in the video, rather than in the region.
+		self.ys = self.grid.ys + self.origin[1]
+		self.xs = self.grid.xs + self.origin[0]
+		self.frames = self.video.frames(configuration['video_loop'])
+
+		self.rate = configuration['video_fps']
+		if self.rate is None:
+			self.rate = self.video.rate
+		self.rate = float(self.rate)
+		self.started = None
+		self.played = 0
+		self.frame = None
+
+	def next_frame(self):
+		try:
+			self.frame = next(self.frames)
+		except StopIteration:
+			raise CaptureFinished("the end of %s" % self.video.file.name)
+		self.played += 1
+
+	def capture(self):
+		if not self.rate:
+			self.next_frame()
+			return
+
+		now = time.time()
+		if self.started is None:
+			self.started = now
+
+		# Frame number due is the one on screen now; wait for the next one if
+		# we already have it, and skip to it if we've fallen behind.
+		due = int((now - self.started) * self.rate)
+		if due < self.played:
+			time.sleep(self.started + (self.played / self.rate) - now)
+			due = self.played
+		while self.played <= due:
+			self.next_frame()
+
+	def scale(self):
+		return self.grid.reduce(self.video.sample(self.frame, self.ys, self.xs))
+
+	def close(self):
+		self.frame = None
+		self.frames.close()
+		self.video.close()
+
+def capture_backend(configuration):
+	"""
+	Set up the capture backend named by capture_backend in the
+	configuration. 'auto' uses MIT-SHM if the X server supports it, and
+	falls back to GTK if not, unless capture_mode asks for GTK's edges
+	capture. 'file' plays video_file instead.
+	"""
+	backend = configuration['capture_backend']
+
+	if backend == 'file':
+		return FileCapture(configuration)
+
+	if backend == 'xshm' and configuration['capture_mode'] == 'edges':
+		print "capture_mode edges only works with GTK, so MIT-SHM captures the whole screen."
+
+	if backend == 'xshm' or (backend == 'auto' and configuration['capture_mode'] != 'edges'):
+		try:
+			return XShmCapture(configuration)
+		except CaptureUnavailable, ex:
+			if backend == 'xshm':
+				raise
+			print "MIT-SHM capture is unavailable (%s), falling back to GTK." % ex
+
+	if configuration['capture_mode'] == 'edges':
+		return GtkEdgeCapture(configuration)
+	return GtkCapture(configuration)
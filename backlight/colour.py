@@ -0,0 +1,78 @@
+# Colour correction for the LED strip, as lookup tables.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy
+
+# Where each channel's table starts in the flattened tables.
+CHANNEL_OFFSETS = numpy.array([0, 256, 512], dtype = numpy.uint16)
+
+def colour_tables(brightness = 1.0, gamma = 1.0, white_point = (255, 255, 255), minimum = 0, divisor = 1):
+	"""
+	Work out what each of the 256 levels of red, green and blue should be
+	sent as, returning a (3, 256) uint8 array.
+
+	Each level is gamma corrected, scaled by the brightness and by that
+	channel's part of the white point, and divided by the divisor. Levels
+	that come out below minimum are turned off, as the LEDs flicker rather
+	than glow when they are that dim. With the defaults, the tables do
+	nothing.
+	"""
+	if len(white_point) != 3:
+		raise ValueError("The white point needs a red, green and blue level, not %s." % (white_point,))
+
+	levels = 255.0 * ((numpy.arange(256) / 255.0) ** gamma)
+	scale = numpy.array(white_point, dtype = float).reshape(3, 1) * brightness / (255.0 * divisor)
+
+	# The small nudge stops levels that should come out whole (like 4 / 2)
+	# being floored down a step by the rounding of the floats on the way.
+	tables = numpy.floor((levels * scale) + 1e-6)
+	tables = numpy.clip(tables, 0, 255).astype(numpy.uint8)
+	tables[tables < minimum] = 0
+	return tables
+
+class ColourCorrector(object):
+	"""
+	Applies the colour tables to a (pixel_count, 3) array of edge pixels,
+	with a single lookup for all of them.
+	"""
+
+	def __init__(self, pixel_count, tables):
+		self.tables = tables.reshape(-1)
+
+		# Reused for every frame: the position of each pixel's level in the
+		# flattened tables, and the corrected pixels.
+		self.indexes = numpy.zeros((pixel_count, 3), dtype = numpy.uint16)
+		self.rgb = numpy.zeros((pixel_count, 3), dtype = numpy.uint8)
+
+	def correct(self, pixels):
+		"""
+		Return the corrected pixels. The array is reused by the next call.
+		"""
+		numpy.add(pixels, CHANNEL_OFFSETS, out = self.indexes)
+		numpy.take(self.tables, self.indexes, out = self.rgb)
+		return self.rgb
+
+def colour_corrector(configuration, pixel_count):
+	"""
+	Build the colour tables from the settings in config.json.
+	"""
+	return ColourCorrector(pixel_count, colour_tables(
+		configuration['brightness'],
+		configuration['gamma'],
+		configuration['white_point'],
+		configuration['colour_minimum'],
+		configuration['colour_divisor']
+	))
@@ -0,0 +1,192 @@
+# The settings the capture script starts with, which config.json overrides.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+DEFAULTS = {
+	# Target host and port number.
+	'host': "10.0.14.200",
+	'port': 8888,
+
+	# The number of pixels actually attached to the TV.
+	'size_x': 46,
+	'size_y': 26,
+
+	# The number of frames to average together (to stop flashing/flickering)
+	# This costs the same whatever it is set to, so it can be raised to 64 or
+	# 128 for smoother output, at the cost of slower response.
+	'average_frames': 16,
+
+	# How many rows in from the top and the bottom, and columns in from the
+	# left and the right, to look for black bars. Movies are often letterboxed
+	# (bars at the top and bottom), and older shows pillarboxed (at the sides).
+	'black_bar_search_height': 8,
+	'black_bar_search_width': 8,
+
+	# A row or column counts as part of a black bar if nothing in it is
+	# brighter than this (out of 255). The bars in compressed video are rarely
+	# quite black.
+	'black_bar_threshold': 10,
+
+	# The number of frames to consider the black bar height for.
+	# The minimum detected bottom from this length is used.
+	# For example, with this at 1024, if we capture at 50fps, then the black bar mininum
+	# for the last 20 seconds is used. This makes it a little slow
+	# to detect the start of movies, but should allow the detection to work through
+	# the movie better, and also deal with non-black-bar videos as well.
+	'black_bar_candidate_length': 1024,
+
+	# Alternatively, the number of seconds to consider the black bar height for.
+	# If set, this is used instead of black_bar_candidate_length, so that the
+	# detection doesn't depend on how fast we can capture.
+	'black_bar_candidate_seconds': None,
+
+	# How the LED strip runs around the TV. For example,
+	# {"start": "bottom", "position": 0.5, "direction": "clockwise",
+	#  "edges": ["left", "top", "right"]} starts in the middle of the bottom and
+	# goes clockwise around the other three edges. The default (None) starts at
+	# the bottom left corner and goes anticlockwise around all four.
+	'layout': None,
+
+	# Divide the colours by this number. This is because the LED
+	# strip tends to be super bright, so this crudely dims it down somewhat.
+	'colour_divisor': 2,
+
+	# Colour correction for the LEDs, which is worked out once into a table of
+	# what to send for each level of each colour. The levels are gamma corrected
+	# (WS2812s look washed out without; try 2.2), scaled by brightness (0 to 1)
+	# and by the white point, the red, green and blue levels that make the
+	# strip look white. Levels below colour_minimum end up off, rather than
+	# flickering. colour_divisor above is applied as well.
+	'brightness': 1.0,
+	'gamma': 1.0,
+	'white_point': [255, 255, 255],
+	'colour_minimum': 0,
+
+	# If set, only send the pixels that have changed by more than this much
+	# since they were last sent, which saves a lot of traffic for most pictures.
+	# A full frame is still sent every delta_keyframe_interval frames, in case
+	# any packets went missing.
+	'delta_threshold': None,
+	'delta_keyframe_interval': 30,
+
+	# Send three bytes per pixel instead of four. This needs the updated sketch,
+	# and fits 198 pixels in a packet instead of 150.
+	'packed_pixels': False,
+
+	# The largest packet the sketch can take (PACKET_MAX_SIZE in the sketch).
+	# Frames bigger than this are split over several packets.
+	'packet_max_size': 600,
+
+	# To send parts of the edge to different controllers, list them here, like:
+	# [{"first": 0, "count": 45, "host": "10.0.14.201"}, {"first": 45, "count": 92}]
+	# Each segment can also override port, input and the options above.
+	'segments': [],
+
+	# Add the time each packet was sent to the end of it, so emulate-sketch.py
+	# can measure the latency. The sketch ignores it.
+	'send_timestamps': False,
+
+	# How to capture the screen. 'xshm' uses the X server's shared memory
+	# extension, which avoids copying the screen through the X socket. 'gtk'
+	# uses GTK, which works everywhere. 'auto' uses 'xshm' if it can. 'file'
+	# plays a video file instead, so no display is needed.
+	'capture_backend': 'auto',
+
+	# The part of the screen to capture, as [x, y, width, height], for when the
+	# TV only shows part of the desktop. The whole screen if not set.
+	'region': None,
+
+	# The video for the 'file' capture_backend: a .y4m file, or raw 8 bit RGB
+	# frames (ffmpeg -f rawvideo -pix_fmt rgb24), which need video_size set, like
+	# "1920x1080". It plays at video_fps, or the rate in the file if not set;
+	# 0 plays every frame as fast as possible, to see how fast the processing
+	# can go. With video_loop, it starts again at the end rather than stopping.
+	'video_file': None,
+	'video_size': None,
+	'video_fps': None,
+	'video_loop': True,
+
+	# What to capture with GTK. 'full' captures the whole screen and scales it
+	# down. 'edges' only captures the screen lines that the edges and the black
+	# bar search use, which is much faster at high resolutions. With 'edges',
+	# the 'auto' capture_backend uses GTK rather than MIT-SHM.
+	'capture_mode': 'full',
+
+	# Each pixel is the average of a zone_depth x zone_depth grid of samples
+	# from its part of the screen, rather than a single screen pixel. This
+	# gives steadier colours, so fewer frames need averaging. The samples are
+	# zone_stride screen pixels apart, or spread across the zone if not set.
+	'zone_depth': 1,
+	'zone_stride': None,
+
+	# Capture, process and send in separate threads, so that each frame takes
+	# as long as the slowest of them rather than all of them added up. Frames
+	# are dropped if a later step is still busy with the last one.
+	'pipeline': False,
+
+	# Capture at this many frames per second, rather than as fast as possible,
+	# which leaves the CPU free for whatever is on the screen. If frames run
+	# late, the next ones are captured sooner to catch up, but never faster
+	# than max_fps.
+	'target_fps': None,
+	'max_fps': None,
+
+	# Skip processing and sending frames when the screen hasn't changed. The
+	# last frame is still sent every keepalive_ms milliseconds, in case the
+	# controller missed it.
+	'skip_unchanged': False,
+	'keepalive_ms': 1000,
+
+	# Rather than capturing all the time, wait for the X server to say that
+	# part of the screen near the edges has changed (with the XDamage
+	# extension). When the screen is still, this only captures a frame every
+	# keepalive_ms milliseconds. Falls back to capturing all the time if the
+	# X server doesn't support it.
+	'capture_on_damage': False,
+
+	# Print a summary of how long each step is taking every this many seconds.
+	# Set to 0 to print the times of every frame instead, which slows things
+	# down a little.
+	'summary_seconds': 10,
+
+	# Serve the timings and counts on this local address, either "host:port"
+	# or the path of a Unix socket, for example "127.0.0.1:8890". Connect to
+	# get JSON, or fetch /metrics over HTTP for Prometheus.
+	'stats_address': None,
+
+	# Listen for commands on this Unix socket, for example
+	# "/tmp/tv-backlight.sock". switch-input.py and send-test-commands-network.py
+	# then go through the running script, which can also be paused, and can
+	# reload config.json without restarting. pipeline, stats_address, the
+	# recording and control_socket itself only change on a restart.
+	'control_socket': None,
+
+	# Record every packet sent, with its timing, to this file, to replay later
+	# with replay-recording.py. The file is set up at record_megabytes to start
+	# with (and cut down to what was used when the script stops), and recording
+	# stops once it's full. A gigabyte is over an hour at 60 frames a second.
+	'record_file': None,
+	'record_megabytes': 1024,
+
+	# To drive several strips from different parts of the screen (or different
+	# videos) at once, list them here, like:
+	# [{"region": [0, 0, 1920, 1080], "input": 1},
+	#  {"region": [1920, 0, 1280, 1024], "input": 2, "size_x": 32}]
+	# Each source can override any of the settings above, and is captured and
+	# processed in a process of its own, so they use all the cores.
+	# control_socket, stats_address and pipeline only work without sources,
+	# and are ignored (with a warning) if sources are listed.
+	'sources': [],
+}
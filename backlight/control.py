@@ -0,0 +1,170 @@
+# A local socket for controlling the running capture script.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import socket
+import threading
+
+class ControlError(Exception):
+	pass
+
+def parse_colour(colour):
+	"""
+	Colours can be given as numbers, or as hex strings like "FF8000".
+	"""
+	try:
+		if isinstance(colour, basestring):
+			value = int(colour, 16)
+		else:
+			value = int(colour)
+	except (ValueError, TypeError):
+		raise ControlError("%r isn't a colour." % (colour,))
+	if not 0 <= value <= 0xFFFFFFFF:
+		raise ControlError("Colour %r is out of range." % (colour,))
+	return value
+
+def parse_input(inp):
+	"""
+	Inputs are a single byte in the packets, so 0 to 255.
+	"""
+	try:
+		value = int(inp)
+	except (ValueError, TypeError):
+		raise ControlError("%r isn't an input number." % (inp,))
+	if not 0 <= value <= 255:
+		raise ControlError("Input %d is out of range (0 to 255)." % value)
+	return value
+
+class ControlServer(object):
+	"""
+	Listens on a Unix socket for commands. Each command is a line of JSON
+	with the command name under "command", and the reply is a line of JSON
+	with "ok" set, and "error" set if it wasn't. A connection can send as
+	many commands as it likes.
+
+	commands maps each command name to a function, which is called with
+	the request and returns a dict to add to the reply, or raises
+	ControlError.
+	"""
+
+	def __init__(self, path, commands):
+		self.path = path
+		self.commands = commands
+
+		# A stale socket file from last time would stop us binding.
+		if os.path.exists(path):
+			os.unlink(path)
+		self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.socket.bind(path)
+		self.socket.listen(5)
+
+		self.thread = threading.Thread(target = self.serve)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def serve(self):
+		while True:
+			try:
+				connection, peer = self.socket.accept()
+			except socket.error:
+				return
+			# Each client gets its own thread, so one that hangs around
+			# doesn't hold up the others.
+			thread = threading.Thread(target = self.handle, args = (connection,))
+			thread.daemon = True
+			thread.start()
+
+	def handle(self, connection):
+		stream = connection.makefile('rw', 0)
+		try:
+			for line in stream:
+				if not line.strip():
+					continue
+				stream.write(json.dumps(self.execute(line)) + '\n')
+		except socket.error:
+			pass
+		except Exception, ex:
+			# Drop this client, but don't take the rest of the script with it.
+			print "Control connection failed: %s" % ex
+		finally:
+			stream.close()
+			connection.close()
+
+	def execute(self, line):
+		try:
+			request = json.loads(line)
+			if not isinstance(request, dict):
+				raise ControlError("Commands are JSON objects, like {\"command\": \"stats\"}.")
+			command = self.commands.get(request.get('command'))
+			if command is None:
+				raise ControlError("Unknown command %s." % request.get('command'))
+			reply = command(request) or {}
+		except (ControlError, ValueError, KeyError, TypeError), ex:
+			return {'ok': False, 'error': str(ex)}
+		except Exception, ex:
+			# Anything else is a bug in the command, but the script carries on.
+			return {'ok': False, 'error': "%s: %s" % (ex.__class__.__name__, ex)}
+		reply['ok'] = True
+		return reply
+
+	def close(self):
+		self.socket.close()
+		if os.path.exists(self.path):
+			os.unlink(self.path)
+
+class ControlClient(object):
+	"""
+	Sends commands to a ControlServer.
+	"""
+
+	def __init__(self, path, timeout = 5):
+		self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.socket.settimeout(timeout)
+		self.socket.connect(path)
+		self.stream = self.socket.makefile('rw', 0)
+
+	def command(self, command, **arguments):
+		"""
+		Run a command, and return the reply. Raises ControlError if the
+		command failed.
+		"""
+		arguments['command'] = command
+		self.stream.write(json.dumps(arguments) + '\n')
+		line = self.stream.readline()
+		if not line:
+			raise ControlError("The capture script closed the connection.")
+		reply = json.loads(line)
+		if not reply.get('ok'):
+			raise ControlError(reply.get('error'))
+		return reply
+
+	def close(self):
+		self.stream.close()
+		self.socket.close()
+
+def connect(configuration):
+	"""
+	Return a ControlClient for the running capture script, or None if it
+	isn't running (or has no control socket).
+	"""
+	path = configuration.get('control_socket')
+	if not path or not os.path.exists(path):
+		return None
+	try:
+		return ControlClient(path)
+	except socket.error:
+		return None
@@ -0,0 +1,163 @@
+# Waits for the X server to report that the screen has changed.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import ctypes
+import math
+import select
+import time
+
+from backlight import xlib
+
+def watched_areas(size, width, height, rows, columns = 1):
+	"""
+	Return the (x, y, width, height) areas of a screen of the given size
+	that a width x height LED grid actually looks at: the given number of
+	grid rows at the top and the bottom, and grid columns at the left and
+	the right (the edges and the black bar search).
+	"""
+	screen_width, screen_height = size
+	zone_width = float(screen_width) / width
+	zone_height = float(screen_height) / height
+	rows = min(rows, height)
+	columns = min(columns, width)
+
+	band_height = int(math.ceil(rows * zone_height))
+	bottom = int((height - rows) * zone_height)
+	column_width = int(math.ceil(columns * zone_width))
+	right = int((width - columns) * zone_width)
+
+	return [
+		(0, 0, screen_width, band_height),
+		(0, bottom, screen_width, screen_height - bottom),
+		(0, 0, column_width, screen_height),
+		(right, 0, screen_width - right, screen_height),
+	]
+
+class DamageWatcher(object):
+	"""
+	Uses the XDamage extension to find out when the screen changes, so
+	that the screen only needs capturing when something we look at has
+	changed. Once it has, settle_frames more frames are captured, so that
+	the average catches up, and a frame is still captured every keepalive
+	seconds regardless.
+
+	Raises xlib.XError if the X server or Xlib doesn't support XDamage.
+	"""
+
+	def __init__(self, areas, settle_frames, keepalive):
+		self.areas = areas
+		self.settle_frames = settle_frames
+		self.keepalive = keepalive
+		self.damage = None
+
+		self.display = xlib.Display()
+		try:
+			self.xdamage = xlib.xdamage()
+
+			event_base = ctypes.c_int()
+			error_base = ctypes.c_int()
+			if not self.xdamage.XDamageQueryExtension(self.display.display, ctypes.byref(event_base), ctypes.byref(error_base)):
+				raise xlib.XError("the X server doesn't support XDamage")
+			self.notify_event = event_base.value + xlib.XDamageNotify
+
+			# The server wants the version agreed before anything else.
+			major = ctypes.c_int(1)
+			minor = ctypes.c_int(1)
+			self.xdamage.XDamageQueryVersion(self.display.display, ctypes.byref(major), ctypes.byref(minor))
+
+			self.damage = self.display.trap_errors(self.xdamage.XDamageCreate,
+				self.display.display, self.display.root, xlib.XDamageReportRawRectangles)
+		except:
+			self.close()
+			raise
+
+		self.event = xlib.XEvent()
+		self.connection = self.display.x11.XConnectionNumber(self.display.display)
+
+		# Capture the first frames regardless, to fill the average.
+		self.pending = settle_frames
+		self.last_frame = time.time()
+
+	def touches(self, x, y, width, height):
+		for area_x, area_y, area_width, area_height in self.areas:
+			if x < area_x + area_width and area_x < x + width and y < area_y + area_height and area_y < y + height:
+				return True
+		return False
+
+	def collect(self):
+		"""
+		Read all the waiting events, and return True if any of the damage
+		touches the areas we look at.
+		"""
+		x11 = self.display.x11
+		display = self.display.display
+		changed = False
+		while x11.XPending(display):
+			x11.XNextEvent(display, ctypes.byref(self.event))
+			if self.event.type != self.notify_event:
+				continue
+			area = ctypes.cast(ctypes.byref(self.event), ctypes.POINTER(xlib.XDamageNotifyEvent)).contents.area
+			if not changed and self.touches(area.x, area.y, area.width, area.height):
+				changed = True
+		return changed
+
+	def wait(self):
+		"""
+		Block until there is a reason to capture the next frame. Returns
+		True if that's only because the keepalive is due, in which case
+		the frame should be sent even if it looks the same as the last one.
+		"""
+		if self.collect():
+			self.pending = self.settle_frames
+
+		keepalive = False
+		while self.pending <= 0:
+			remaining = (self.last_frame + self.keepalive) - time.time()
+			if remaining <= 0:
+				keepalive = True
+				break
+			select.select([self.connection], [], [], remaining)
+			if self.collect():
+				self.pending = self.settle_frames
+
+		self.pending = max(self.pending - 1, 0)
+		self.last_frame = time.time()
+		return keepalive
+
+	def close(self):
+		if self.damage:
+			self.xdamage.XDamageDestroy(self.display.display, self.damage)
+			self.damage = None
+		self.display.close()
+
+def damage_watcher(configuration, size, origin = (0, 0)):
+	"""
+	Set up a DamageWatcher for the part of the screen of the given size at
+	origin, or return None (and carry on polling) if XDamage can't be used.
+	"""
+	areas = watched_areas(
+		size,
+		configuration['size_x'],
+		configuration['size_y'],
+		configuration['black_bar_search_height'] + 1,
+		configuration['black_bar_search_width'] + 1
+	)
+	areas = [(x + origin[0], y + origin[1], width, height) for x, y, width, height in areas]
+	try:
+		return DamageWatcher(areas, configuration['average_frames'], configuration['keepalive_ms'] / 1000.0)
+	except xlib.XError, ex:
+		print "XDamage is unavailable (%s), capturing every frame instead." % ex
+		return None
@@ -0,0 +1,170 @@
+# Pulls the edge pixels out of a downscaled frame, in the order that the
+# LED strip is wired around the TV.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy
+
+# The edges of the screen, as the layout names them.
+EDGES = ['top', 'right', 'bottom', 'left']
+
+# How the strip ran before the layout could be set: from the bottom left
+# corner, along the bottom and anticlockwise around the screen.
+DEFAULT_LAYOUT = {
+	'start': 'bottom',
+	'position': 0,
+	'direction': 'anticlockwise',
+	'edges': EDGES,
+}
+
+def perimeter(width, height, direction):
+	"""
+	Return the cells around the edge of a width x height grid, starting
+	at the top left corner and going in the given direction, as a list of
+	(x, y, edge leaving the cell, edge arriving at the cell). These are
+	only different for the corners, which are one cell each.
+	"""
+	right = width - 1
+	bottom = height - 1
+	if direction == 'clockwise':
+		sides = [
+			('top', (0, 0), (right, 0)),
+			('right', (right, 0), (right, bottom)),
+			('bottom', (right, bottom), (0, bottom)),
+			('left', (0, bottom), (0, 0)),
+		]
+	elif direction == 'anticlockwise':
+		sides = [
+			('left', (0, 0), (0, bottom)),
+			('bottom', (0, bottom), (right, bottom)),
+			('right', (right, bottom), (right, 0)),
+			('top', (right, 0), (0, 0)),
+		]
+	else:
+		raise ValueError("The layout direction must be clockwise or anticlockwise, not %s." % direction)
+
+	cells = []
+	for index, (edge, start, end) in enumerate(sides):
+		previous = sides[index - 1][0]
+		dx = cmp(end[0], start[0])
+		dy = cmp(end[1], start[1])
+		for step in range(max(abs(end[0] - start[0]), abs(end[1] - start[1]))):
+			cells.append((start[0] + (dx * step), start[1] + (dy * step), edge, previous if step == 0 else edge))
+	return cells
+
+class LedLayout(object):
+	"""
+	Where each LED on the strip takes its colour from in the width x height
+	grid, worked out once from a layout description like:
+
+		{"start": "bottom", "position": 0.5, "direction": "clockwise",
+		 "edges": ["left", "top", "right"]}
+
+	The strip starts at the given position along the start edge (0 is the
+	left or top end, 1 the right or bottom end), and runs in the given
+	direction, as you look at the screen, around the edges listed. Edges
+	that aren't listed are skipped. Anything not given is taken from
+	DEFAULT_LAYOUT.
+
+	Each corner is one LED, which is there if either edge it joins is.
+	When there are black bars, the LEDs take their colours from the
+	nearest part of the picture instead.
+	"""
+
+	def __init__(self, width, height, description = None):
+		self.width = width
+		self.height = height
+
+		layout = dict(DEFAULT_LAYOUT)
+		layout.update(description or {})
+		edges = set(layout['edges'])
+		for edge in [layout['start']] + list(edges):
+			if edge not in EDGES:
+				raise ValueError("Unknown edge %s in the layout." % edge)
+
+		# Find the cell the strip starts at, and go around from there.
+		cells = perimeter(width, height, layout['direction'])
+		position = float(layout['position'])
+		if not 0 <= position <= 1:
+			raise ValueError("The layout position must be between 0 and 1, not %s." % layout['position'])
+		start = {
+			'top': (int(round(position * (width - 1))), 0),
+			'bottom': (int(round(position * (width - 1))), height - 1),
+			'left': (0, int(round(position * (height - 1)))),
+			'right': (width - 1, int(round(position * (height - 1)))),
+		}[layout['start']]
+		first = [(x, y) for x, y, leaving, arriving in cells].index(start)
+		cells = cells[first:] + cells[:first]
+
+		cells = [(x, y) for x, y, leaving, arriving in cells if leaving in edges or arriving in edges]
+		if not cells:
+			raise ValueError("The layout doesn't include any edges.")
+
+		self.xs = numpy.array([x for x, y in cells], dtype = numpy.intp)
+		self.ys = numpy.array([y for x, y in cells], dtype = numpy.intp)
+		self.pixel_count = len(cells)
+
+	def index(self, black_top = 0, black_bottom = None, black_left = 0, black_right = None):
+		"""
+		Return the position of each LED in the grid flattened to
+		(height * width), moved in to the picture inside the given first
+		and last rows and columns, so that none of them are in the black
+		bars.
+		"""
+		if black_bottom is None:
+			black_bottom = self.height - 1
+		if black_right is None:
+			black_right = self.width - 1
+		rows = numpy.clip(self.ys, black_top, black_bottom)
+		columns = numpy.clip(self.xs, black_left, black_right)
+		return (rows * self.width) + columns
+
+class EdgeExtractor(object):
+	"""
+	Gathers the edge pixels out of a (height, width, 3) pixel array in
+	one go, in the order of the LED layout.
+	"""
+
+	def __init__(self, width, height, layout = None):
+		self.width = width
+		self.height = height
+		self.layout = LedLayout(width, height, layout)
+		self.pixel_count = self.layout.pixel_count
+
+		# The gather indexes only depend on the black bars, which don't
+		# change very often, so keep them around once worked out.
+		self._indexes = {}
+
+		# Reused for the output of each frame.
+		self.rgb = numpy.zeros((self.pixel_count, 3), dtype = numpy.uint8)
+
+	def index(self, black_top, black_bottom, black_left, black_right):
+		key = (black_top, black_bottom, black_left, black_right)
+		if key not in self._indexes:
+			self._indexes[key] = self.layout.index(black_top, black_bottom, black_left, black_right)
+		return self._indexes[key]
+
+	def extract(self, pixel_array, black_top, black_bottom, black_left, black_right):
+		"""
+		Return the edge pixels as a (pixel_count, 3) RGB array. The array
+		is reused by the next call, so copy it if you need to keep it.
+		"""
+		index = self.index(black_top, black_bottom, black_left, black_right)
+		pixels = pixel_array.reshape(-1, pixel_array.shape[-1])
+		if pixels.shape[1] == 3:
+			numpy.take(pixels, index, axis = 0, out = self.rgb)
+		else:
+			self.rgb[...] = pixels[index, :3]
+		return self.rgb
@@ -0,0 +1,164 @@
+# Behaves like the TVBacklight sketch, for testing without an Arduino.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy
+
+from backlight import protocol
+
+# How far past the end of its packet buffer the sketch can read. The 'P'
+# handler reads the whole of the last word that starts inside the buffer.
+OVERRUN = 4
+
+class SketchEmulator(object):
+	"""
+	Does what the sketch's loop() does with each packet, to the letter:
+	packets are cut off at max_size bytes, anything after that in the
+	buffer is left over from earlier packets, the pixel data is filtered
+	by the current input, and pixels off the end of the strip are
+	ignored. Bytes read past the end of the buffer read as zero.
+
+	receive() returns how many times the strip would have been shown.
+	"""
+
+	def __init__(self, strip_pixels = 150, max_size = protocol.PACKET_MAX_SIZE):
+		self.strip_pixels = strip_pixels
+		self.max_size = max_size
+
+		# The sketch's packetBuffer, which each packet only partly overwrites.
+		self.buffer = bytearray(max_size + OVERRUN)
+		self.bytes = numpy.frombuffer(self.buffer, dtype = numpy.uint8)
+
+		# What the strip is set to, red, green, blue, and what it's showing.
+		self.pixels = numpy.zeros((strip_pixels, 3), dtype = numpy.uint8)
+		self.shown = self.pixels.copy()
+
+		self.input = 0
+		self.frame_sequence = 0
+		self.frame_received = 0
+		self.frame_pending = False
+
+		# Fragmented frames shown before all their pixels arrived.
+		self.incomplete_frames = 0
+
+	def u16(self, offset):
+		return self.buffer[offset] | (self.buffer[offset + 1] << 8)
+
+	def set_words(self, first, offset, count):
+		"""
+		Set count pixels from first, from the 0x00RRGGBB words at offset.
+		"""
+		self.set_colours(first, self.bytes[offset:offset + (count * 4)].reshape(count, 4)[:, 2::-1])
+
+	def set_colours(self, first, colours):
+		# setPixelColor ignores pixels off the end of the strip.
+		end = min(first + len(colours), self.strip_pixels)
+		if end > first:
+			self.pixels[first:end] = colours[:end - first]
+
+	def show(self):
+		self.shown[...] = self.pixels
+		return 1
+
+	def receive(self, packet):
+		data_size = min(len(packet), self.max_size)
+		if data_size == 0:
+			# parsePacket() says there's nothing there.
+			return 0
+		self.buffer[:data_size] = packet[:data_size]
+
+		kind = chr(self.buffer[0])
+		if kind == protocol.PACKET_INPUT:
+			return self.receive_input()
+		if kind == protocol.PACKET_PIXELS:
+			return self.receive_pixels()
+		if kind == protocol.PACKET_PACKED:
+			return self.receive_packed(data_size)
+		if kind == protocol.PACKET_FRAGMENT:
+			return self.receive_fragment(data_size)
+		if kind == protocol.PACKET_DELTA:
+			return self.receive_delta(data_size)
+		return 0
+
+	def receive_input(self):
+		self.input = self.buffer[1]
+		self.pixels[...] = self.bytes[2:6][2::-1]
+		return self.show()
+
+	def receive_pixels(self):
+		if self.buffer[1] != self.input:
+			return 0
+		# Only the words that start inside the buffer are used.
+		count = min(self.u16(2), (self.max_size + 3) // 4)
+		self.set_words(0, 4, count)
+		return self.show()
+
+	def receive_packed(self, data_size):
+		if self.buffer[1] != self.input or self.buffer[2] != protocol.PACKED_VERSION:
+			return 0
+		count = min(self.u16(3), max((data_size - 5) // 3, 0))
+		self.set_colours(0, self.bytes[5:5 + (count * 3)].reshape(count, 3))
+		return self.show()
+
+	def receive_fragment(self, data_size):
+		if self.buffer[1] != self.input:
+			return 0
+
+		shows = 0
+		sequence = self.buffer[2]
+		bytes_per_pixel = self.buffer[3]
+		frame_size = self.u16(4)
+		first = self.u16(6)
+		count = self.u16(8)
+
+		if sequence != self.frame_sequence:
+			if self.frame_pending:
+				self.incomplete_frames += 1
+				shows += self.show()
+			self.frame_sequence = sequence
+			self.frame_received = 0
+			self.frame_pending = False
+
+		if bytes_per_pixel in (3, 4):
+			count = min(count, max((data_size - 10) // bytes_per_pixel, 0))
+			data = self.bytes[10:10 + (count * bytes_per_pixel)].reshape(count, bytes_per_pixel)
+			if bytes_per_pixel == 4:
+				data = data[:, 2::-1]
+			self.set_colours(first, data)
+			if count:
+				self.frame_received = (self.frame_received + count) & 0xFFFF
+				self.frame_pending = True
+
+		if self.frame_pending and self.frame_received >= frame_size:
+			shows += self.show()
+			self.frame_pending = False
+		return shows
+
+	def receive_delta(self, data_size):
+		if self.buffer[1] != self.input:
+			return 0
+
+		offset = 3
+		for run in range(self.buffer[2]):
+			if offset + 3 > data_size:
+				break
+			first = self.u16(offset)
+			length = self.buffer[offset + 2]
+			offset += 3
+
+			count = min(length, max((data_size - offset) // 4, 0))
+			self.set_words(first, offset, count)
+			offset += count * 4
+		return self.show()
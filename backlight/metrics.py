@@ -0,0 +1,271 @@
+# Keeps track of how long each step takes, and serves the numbers.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import collections
+import json
+import os
+import socket
+import threading
+import time
+
+# The histogram buckets, in seconds. A frame at 60fps has 0.0167s.
+BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0]
+
+# The percentiles kept over the recent frames.
+PERCENTILES = [50, 95, 99]
+
+class Histogram(object):
+	"""
+	Counts how many times fall into each of the fixed buckets, for as long
+	as we've been running, and keeps the last window times to work out
+	percentiles of the recent frames from.
+	"""
+
+	def __init__(self, window = 1000):
+		self.counts = [0] * (len(BUCKETS) + 1)
+		self.count = 0
+		self.sum = 0.0
+		self.recent = collections.deque(maxlen = window)
+
+	def record(self, seconds):
+		self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+		self.count += 1
+		self.sum += seconds
+		self.recent.append(seconds)
+
+	def percentiles(self):
+		"""
+		Return the PERCENTILES of the recent times, or None if there aren't any.
+		"""
+		if not self.recent:
+			return dict((percentile, None) for percentile in PERCENTILES)
+		ordered = sorted(self.recent)
+		return dict((percentile, ordered[min(len(ordered) * percentile // 100, len(ordered) - 1)]) for percentile in PERCENTILES)
+
+	def buckets(self):
+		"""
+		Return a list of (upper bound, cumulative count), ending with the
+		total count against None (infinity).
+		"""
+		result = []
+		total = 0
+		for bound, count in zip(BUCKETS + [None], self.counts):
+			total += count
+			result.append((bound, total))
+		return result
+
+class Metrics(object):
+	"""
+	Records how long each stage of each frame takes, and counts of things
+	like dropped frames. Recording is a few list operations, so it is
+	cheap enough to do every frame; the expensive bits only happen when a
+	summary or snapshot is asked for.
+	"""
+
+	def __init__(self, stages, window = 1000):
+		self.stages = stages
+		self.histograms = dict((stage, Histogram(window)) for stage in stages)
+		self.counters = collections.defaultdict(int)
+
+		# Counters that are kept somewhere else, as functions to read them.
+		self.sources = {}
+
+		self.lock = threading.Lock()
+		self.started = time.time()
+		self.last_summary = (self.started, 0)
+
+	def record(self, stage, seconds):
+		with self.lock:
+			self.histograms[stage].record(seconds)
+
+	def increment(self, counter, count = 1):
+		with self.lock:
+			self.counters[counter] += count
+
+	def add_source(self, counter, function):
+		"""
+		Report the count returned by function as counter.
+		"""
+		self.sources[counter] = function
+
+	def read_counters(self):
+		counters = dict(self.counters)
+		for counter, function in self.sources.items():
+			counters[counter] = function()
+		return counters
+
+	def snapshot(self):
+		"""
+		Return everything as a dict, ready to be turned into JSON.
+		"""
+		with self.lock:
+			stages = {}
+			for stage in self.stages:
+				histogram = self.histograms[stage]
+				percentiles = histogram.percentiles()
+				stages[stage] = {
+					'count': histogram.count,
+					'sum': histogram.sum,
+					'buckets': [[bound, count] for bound, count in histogram.buckets()],
+				}
+				for percentile in PERCENTILES:
+					stages[stage]['p%d' % percentile] = percentiles[percentile]
+			counters = self.read_counters()
+
+		return {
+			'uptime': time.time() - self.started,
+			'stages': stages,
+			'counters': counters,
+		}
+
+	def prometheus(self):
+		"""
+		Return everything in the Prometheus text format.
+		"""
+		snapshot = self.snapshot()
+		lines = []
+
+		lines.append('# TYPE backlight_stage_seconds histogram')
+		for stage in self.stages:
+			values = snapshot['stages'][stage]
+			for bound, count in values['buckets']:
+				if bound is None:
+					bound = '+Inf'
+				lines.append('backlight_stage_seconds_bucket{stage="%s",le="%s"} %d' % (stage, bound, count))
+			lines.append('backlight_stage_seconds_sum{stage="%s"} %r' % (stage, values['sum']))
+			lines.append('backlight_stage_seconds_count{stage="%s"} %d' % (stage, values['count']))
+
+		lines.append('# TYPE backlight_stage_recent_seconds gauge')
+		for stage in self.stages:
+			for percentile in PERCENTILES:
+				value = snapshot['stages'][stage]['p%d' % percentile]
+				if value is not None:
+					lines.append('backlight_stage_recent_seconds{stage="%s",quantile="%s"} %r' % (stage, percentile / 100.0, value))
+
+		for counter, value in sorted(snapshot['counters'].items()):
+			lines.append('# TYPE backlight_%s_total counter' % counter)
+			lines.append('backlight_%s_total %d' % (counter, value))
+
+		lines.append('# TYPE backlight_uptime_seconds gauge')
+		lines.append('backlight_uptime_seconds %r' % snapshot['uptime'])
+		return '\n'.join(lines) + '\n'
+
+	def summary(self, counter = 'frames'):
+		"""
+		Return a line summarising the recent frames, with the frame rate
+		worked out from the given counter since the last summary.
+		"""
+		now = time.time()
+		with self.lock:
+			parts = []
+			for stage in self.stages:
+				percentiles = self.histograms[stage].percentiles()
+				if percentiles[50] is None:
+					continue
+				parts.append("%s %0.4fs/%0.4fs" % (stage.capitalize(), percentiles[50], percentiles[95]))
+			counters = self.read_counters()
+
+		since, last_count = self.last_summary
+		count = counters.get(counter, 0)
+		self.last_summary = (now, count)
+
+		line = "FPS %0.2f. p50/p95: %s." % ((count - last_count) / max(now - since, 0.0001), ', '.join(parts))
+		others = ["%s %d" % (name.replace('_', ' ').capitalize(), value) for name, value in sorted(counters.items()) if name != counter]
+		if others:
+			line += " " + ', '.join(others) + "."
+		return line
+
+class StatsServer(object):
+	"""
+	Serves snapshots of the metrics on a local TCP port ("host:port") or a
+	Unix socket (a path). Connect and you get JSON back; send
+	"prometheus" first for the Prometheus text format. HTTP GETs work as
+	well, with /metrics for Prometheus and anything else for JSON, so it
+	can be scraped directly or checked with curl.
+	"""
+
+	def __init__(self, metrics, address):
+		self.metrics = metrics
+		self.address = address
+		self.unix = address.startswith('/') or ':' not in address
+
+		if not self.unix:
+			host, port = address.rsplit(':', 1)
+			self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+			self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+			self.socket.bind((host, int(port)))
+		else:
+			# A stale socket file from last time would stop us binding.
+			if os.path.exists(address):
+				os.unlink(address)
+			self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			self.socket.bind(address)
+		self.socket.listen(5)
+
+		self.thread = threading.Thread(target = self.serve)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def serve(self):
+		while True:
+			try:
+				connection, peer = self.socket.accept()
+			except socket.error:
+				return
+			# Whatever goes wrong with one request, keep serving the rest.
+			try:
+				self.handle(connection)
+			except socket.error:
+				pass
+			except Exception, ex:
+				print "Unable to serve the stats: %s" % ex
+			finally:
+				connection.close()
+
+	def handle(self, connection):
+		# Give the client a moment to say what it wants, but don't hang
+		# about if it says nothing.
+		connection.settimeout(0.5)
+		try:
+			request = connection.recv(1024)
+		except socket.timeout:
+			request = ''
+
+		http = request.startswith('GET ')
+		if http:
+			path = request.split()[1] if len(request.split()) > 1 else '/'
+			prometheus = path.startswith('/metrics')
+		else:
+			prometheus = request.strip().lower() == 'prometheus'
+
+		if prometheus:
+			body = self.metrics.prometheus()
+			content_type = 'text/plain; version=0.0.4'
+		else:
+			body = json.dumps(self.metrics.snapshot(), sort_keys = True) + '\n'
+			content_type = 'application/json'
+
+		connection.settimeout(None)
+		if http:
+			connection.sendall('HTTP/1.0 200 OK\r\nContent-Type: %s\r\nContent-Length: %d\r\n\r\n' % (content_type, len(body)))
+		connection.sendall(body)
+
+	def close(self):
+		self.socket.close()
+		if self.unix:
+			if os.path.exists(self.address):
+				os.unlink(self.address)
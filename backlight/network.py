@@ -0,0 +1,263 @@
+# Sends the packets to the TVBacklight sketch.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import errno
+import socket
+import time
+
+from backlight import protocol
+
+# Errors that mean this packet didn't fit in the socket buffer, rather than
+# anything being wrong with the network. The packet is dropped.
+BUFFER_FULL = (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS)
+
+# When the network goes away, the socket is reopened after BACKOFF_MIN
+# seconds, then twice as long each time it fails again, up to BACKOFF_MAX.
+BACKOFF_MIN = 0.05
+BACKOFF_MAX = 2.0
+
+class PixelSender(object):
+	"""
+	Sends pixel packets to one controller. The socket is opened once and
+	connected, so the host is only resolved at startup, and the packet
+	buffer is reused for every frame.
+
+	Sending never blocks or raises. If the network goes away (as it does
+	while a laptop resumes from sleep), each frame after that is still
+	tried, as a full frame, so the strip catches up with the first one
+	that gets through, and the socket is reopened now and again, backing
+	off the longer the network is gone. Nothing is queued up meanwhile;
+	only the latest frame matters.
+	"""
+
+	def __init__(self, host, port, inp, pixel_count, delta_threshold = None, keyframe_interval = 30, packed = False, max_size = protocol.PACKET_MAX_SIZE, timestamps = False, recorder = None):
+		self.address = (host, port)
+
+		# The trailer has to fit in the packet too.
+		if timestamps:
+			max_size -= protocol.TRAILER.size
+
+		# Only send the changed pixels, if asked to.
+		if delta_threshold is not None:
+			self.packet = protocol.DeltaPacket(inp, pixel_count, delta_threshold, keyframe_interval, max_size, packed)
+		else:
+			self.packet = protocol.frame_packet(inp, pixel_count, max_size, packed)
+
+		# How many packets couldn't be sent, and how many times the network
+		# has gone away.
+		self.errors = 0
+		self.outages = 0
+
+		# Add a trailer with the packet number and time to every packet.
+		self.timestamps = timestamps
+		self.sequence = 0
+
+		# If set, a PacketRecorder that gets a copy of every packet sent.
+		self.recorder = recorder
+
+		# When the network went away, if it has, and when to reopen the socket.
+		self.down_since = None
+		self.backoff = BACKOFF_MIN
+		self.reconnect_at = 0
+
+		# An input switch that hasn't got through yet.
+		self.pending_input = None
+
+		self.socket = None
+		try:
+			self.connect()
+		except socket.error, ex:
+			self.lost(ex)
+
+	def connect(self):
+		if self.socket:
+			self.socket.close()
+		self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.socket.setblocking(False)
+		self.socket.connect(self.address)
+
+	def send(self, rgb):
+		"""
+		Send a frame of (pixel_count, 3) RGB edge pixels.
+		"""
+		if self.prepare():
+			self.transmit(self.packet.pack(rgb))
+
+	def prepare(self):
+		"""
+		Get ready to send the next frame: while the network is gone, try
+		to get it back, and send any input switch that hasn't got through
+		yet. Returns whether the frame should be sent.
+		"""
+		if self.down_since is not None:
+			self.retry()
+		if self.pending_input is not None:
+			if not self.transmit([self.pending_input]):
+				return False
+			self.pending_input = None
+		return True
+
+	def set_input(self, inp):
+		"""
+		Send the following frames to inp.
+		"""
+		self.packet.set_input(inp)
+
+	def send_input(self, inp, colour = 0):
+		"""
+		Switch the controller to inp, filling the strip with colour, and
+		send the following frames to that input. If it can't be sent now,
+		it is sent before the next frame that can.
+		"""
+		self.set_input(inp)
+		packet = memoryview(protocol.input_packet(inp, colour))
+		self.pending_input = None if self.transmit([packet]) else packet
+
+	def retry(self):
+		"""
+		While the network is gone, reopen the socket once the backoff is
+		up, and make sure whatever gets through next is a full frame.
+		"""
+		if isinstance(self.packet, protocol.DeltaPacket):
+			self.packet.resend()
+
+		now = time.time()
+		if now < self.reconnect_at:
+			return
+		self.backoff = min(self.backoff * 2, BACKOFF_MAX)
+		self.reconnect_at = now + self.backoff
+		try:
+			self.connect()
+		except socket.error:
+			pass
+
+	def lost(self, ex):
+		if self.down_since is None:
+			print "Unable to send to %s:%d (%s), retrying." % (self.address[0], self.address[1], ex)
+			self.down_since = time.time()
+			self.backoff = BACKOFF_MIN
+			self.reconnect_at = self.down_since + self.backoff
+			self.outages += 1
+
+	def transmit(self, messages):
+		"""
+		Send packets that have already been packed, and return whether
+		they all got through.
+		"""
+		if self.socket is None:
+			return False
+
+		for message in messages:
+			if self.timestamps:
+				self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+				message = message.tobytes() + protocol.TRAILER.pack(protocol.TRAILER_MAGIC, self.sequence, time.time())
+			if self.recorder:
+				self.recorder.record(message)
+			try:
+				self.socket.send(message)
+			except socket.error, ex:
+				self.errors += 1
+				# A connected UDP socket reports ICMP port unreachable from the
+				# last packet. The controller is just not listening (yet), which
+				# we never noticed before we connected the socket, so carry on.
+				if ex.errno == errno.ECONNREFUSED:
+					continue
+				if ex.errno in BUFFER_FULL:
+					return False
+				self.lost(ex)
+				return False
+
+		if self.down_since is not None:
+			print "Sending to %s:%d again after %0.1fs." % (self.address[0], self.address[1], time.time() - self.down_since)
+			self.down_since = None
+		return True
+
+	def close(self):
+		if self.socket:
+			self.socket.close()
+
+class SegmentedSender(object):
+	"""
+	Sends ranges of the edge pixels to different controllers, for when
+	each edge (or each room) has its own strip. Every segment is packed
+	from the same frame, and then they are all sent together.
+	"""
+
+	def __init__(self, segments):
+		# A list of (first pixel, pixel count, PixelSender).
+		self.segments = segments
+
+	@property
+	def errors(self):
+		return sum(sender.errors for first, count, sender in self.segments)
+
+	@property
+	def outages(self):
+		return sum(sender.outages for first, count, sender in self.segments)
+
+	def send(self, rgb):
+		batch = []
+		for first, count, sender in self.segments:
+			if sender.prepare():
+				batch.append((sender, sender.packet.pack(rgb[first:first + count])))
+		for sender, messages in batch:
+			sender.transmit(messages)
+
+	def set_input(self, inp):
+		for first, count, sender in self.segments:
+			sender.set_input(inp)
+
+	def send_input(self, inp, colour = 0):
+		for first, count, sender in self.segments:
+			sender.send_input(inp, colour)
+
+	def close(self):
+		for first, count, sender in self.segments:
+			sender.close()
+
+def sender_for(configuration, pixel_count, recorder = None):
+	"""
+	Set up the sender from the configuration. Without any segments, all
+	the pixels go to the one host and port. Each segment can override any
+	of the sending options, and defaults to the top level ones. If given,
+	the recorder records the packets sent to all of them.
+	"""
+	segments = configuration.get('segments')
+	if not segments:
+		segments = [{'first': 0, 'count': pixel_count}]
+
+	senders = []
+	for segment in segments:
+		settings = dict(configuration)
+		settings.update(segment)
+		if settings['first'] < 0 or settings['first'] + settings['count'] > pixel_count:
+			raise ValueError("Segment of %d pixels from %d is outside the %d edge pixels." % (settings['count'], settings['first'], pixel_count))
+
+		sender = PixelSender(
+			settings['host'],
+			settings['port'],
+			settings['input'],
+			settings['count'],
+			settings['delta_threshold'],
+			settings['delta_keyframe_interval'],
+			settings['packed_pixels'],
+			settings['packet_max_size'],
+			settings['send_timestamps'],
+			recorder
+		)
+		senders.append((settings['first'], settings['count'], sender))
+
+	return SegmentedSender(senders)
@@ -0,0 +1,98 @@
+# Paces the capture loop, and skips frames where nothing has changed.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import zlib
+
+class FramePacer(object):
+	"""
+	Keeps the capture loop to target_fps rather than letting it spin as
+	fast as it can. Frames that run late are caught up on, but never
+	faster than max_fps. Either can be None, for no limit.
+	"""
+
+	def __init__(self, target_fps = None, max_fps = None):
+		self.interval = 1.0 / target_fps if target_fps else 0
+		self.min_interval = 1.0 / max_fps if max_fps else 0
+		self.next_frame = None
+		self.last_frame = None
+
+	def wait(self):
+		"""
+		Sleep until it's time for the next frame, and return that time.
+		"""
+		now = time.time()
+		start = now
+		if self.interval and self.next_frame is not None:
+			start = max(start, self.next_frame)
+		if self.last_frame is not None:
+			start = max(start, self.last_frame + self.min_interval)
+
+		if start > now:
+			time.sleep(start - now)
+
+		if self.interval:
+			# If we've fallen more than a frame behind, don't try and make
+			# all of it up; just carry on from here.
+			if self.next_frame is None or start - self.next_frame > self.interval:
+				self.next_frame = start + self.interval
+			else:
+				self.next_frame += self.interval
+
+		self.last_frame = start
+		return start
+
+class ChangeDetector(object):
+	"""
+	Spots when the captured frames have stopped changing, so the
+	processing and sending can be skipped. Frames are only skipped once
+	settle_frames identical frames in a row have been seen (the number of
+	frames averaged, so the average has caught up with the picture), and
+	one is still let through every keepalive seconds.
+	"""
+
+	def __init__(self, settle_frames, keepalive):
+		self.settle_frames = settle_frames
+		self.keepalive = keepalive
+		self.fingerprint = None
+		self.unchanged = 0
+		self.last_passed = None
+		self.skipped = 0
+
+	def changed(self, frame, now = None, keepalive = False):
+		"""
+		Return True if this frame (a contiguous array) should be processed.
+		If keepalive is set, the frame is let through whether or not it has
+		changed, and counts as the keepalive.
+		"""
+		if now is None:
+			now = time.time()
+
+		# A checksum of the scaled down frame is plenty to spot changes,
+		# and costs next to nothing.
+		fingerprint = zlib.crc32(frame)
+		if fingerprint == self.fingerprint:
+			self.unchanged += 1
+		else:
+			self.fingerprint = fingerprint
+			self.unchanged = 0
+
+		if keepalive or self.unchanged < self.settle_frames or self.last_passed is None or now - self.last_passed >= self.keepalive:
+			self.last_passed = now
+			return True
+
+		self.skipped += 1
+		return False
@@ -0,0 +1,135 @@
+# Runs the capture, processing and sending in separate threads.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import threading
+import time
+
+class PipelineClosed(Exception):
+	pass
+
+class LatestSlot(object):
+	"""
+	Hands frames from one pipeline stage to the next. It only holds one
+	frame; putting a frame into a full slot replaces the one there, so a
+	stage that falls behind always gets the newest frame, and the stale
+	ones are dropped rather than queued up.
+	"""
+
+	def __init__(self):
+		self.condition = threading.Condition()
+		self.item = None
+		self.full = False
+		self.closed = False
+		self.dropped = 0
+
+	def put(self, item):
+		self.condition.acquire()
+		try:
+			if self.full:
+				self.dropped += 1
+			self.item = item
+			self.full = True
+			self.condition.notify()
+		finally:
+			self.condition.release()
+
+	def get(self):
+		self.condition.acquire()
+		try:
+			while not self.full and not self.closed:
+				self.condition.wait()
+			if not self.full:
+				raise PipelineClosed()
+			item = self.item
+			self.item = None
+			self.full = False
+			return item
+		finally:
+			self.condition.release()
+
+	def close(self):
+		self.condition.acquire()
+		try:
+			self.closed = True
+			self.condition.notify_all()
+		finally:
+			self.condition.release()
+
+class Pipeline(object):
+	"""
+	Runs each stage in its own thread, joined by LatestSlots. The first
+	stage is called with no arguments, and each later stage is called with
+	what the stage before it returned. A stage can return None to pass
+	nothing on. Throughput is then set by the slowest stage rather than
+	the total of all of them.
+	"""
+
+	def __init__(self, *stages):
+		self.stages = stages
+		self.slots = [LatestSlot() for i in range(len(stages) - 1)]
+		self.threads = []
+		self.running = False
+		self.error = None
+
+	@property
+	def dropped(self):
+		return sum(slot.dropped for slot in self.slots)
+
+	def start(self):
+		self.running = True
+		for index in range(len(self.stages)):
+			thread = threading.Thread(target = self.run_stage, args = (index,))
+			thread.daemon = True
+			thread.start()
+			self.threads.append(thread)
+
+	def run_stage(self, index):
+		stage = self.stages[index]
+		try:
+			while self.running:
+				if index == 0:
+					item = stage()
+				else:
+					item = stage(self.slots[index - 1].get())
+				if item is not None and index < len(self.slots):
+					self.slots[index].put(item)
+		except PipelineClosed:
+			pass
+		except:
+			self.error = sys.exc_info()
+			self.stop()
+
+	def stop(self):
+		self.running = False
+		for slot in self.slots:
+			slot.close()
+
+	def run(self):
+		"""
+		Run the pipeline until a stage fails (which is raised here) or
+		we're interrupted.
+		"""
+		self.start()
+		try:
+			# Sleep rather than join, so Ctrl-C still works.
+			while self.running:
+				time.sleep(0.2)
+		finally:
+			self.stop()
+
+		if self.error is not None:
+			raise self.error[0], self.error[1], self.error[2]
@@ -0,0 +1,67 @@
+# Turns the scaled down frames into the edge pixels to send.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from backlight.averaging import FrameAverager
+from backlight.blackbars import BlackBarDetector, BlackBarTracker
+from backlight.colour import colour_corrector
+from backlight.edges import EdgeExtractor
+
+class FrameProcessor(object):
+	"""
+	Averages each scaled down frame with the last ones, finds the black
+	bars, and pulls out and colour corrects the edge pixels. The capture
+	script times each of these steps separately, so they are separate
+	calls.
+	"""
+
+	def __init__(self, configuration):
+		self.width = configuration['size_x']
+		self.height = configuration['size_y']
+
+		self.averager = FrameAverager(self.width, self.height, configuration['average_frames'])
+		self.edge_extractor = EdgeExtractor(self.width, self.height, configuration['layout'])
+		self.pixel_count = self.edge_extractor.pixel_count
+		self.colour_corrector = colour_corrector(configuration, self.pixel_count)
+
+		self.black_bar_detector = BlackBarDetector(
+			self.width,
+			self.height,
+			configuration['black_bar_search_height'],
+			configuration['black_bar_search_width'],
+			configuration['black_bar_threshold']
+		)
+		self.black_bar_tracker = BlackBarTracker(configuration['black_bar_candidate_length'], configuration['black_bar_candidate_seconds'])
+
+	def average(self, scaled):
+		"""
+		Average with the last frames. The result is reused by the next call.
+		"""
+		return self.averager.push(scaled)
+
+	def find_black_bars(self, pixel_array, now = None):
+		"""
+		Search for the black bars, and return the (top, bottom, left,
+		right) rows and columns to take the edges from.
+		"""
+		black_top, black_bottom, black_left, black_right = self.black_bar_detector.detect(pixel_array)
+		return self.black_bar_tracker.update(black_top, black_bottom, black_left, black_right, now)
+
+	def extract(self, pixel_array, black_top, black_bottom, black_left, black_right):
+		"""
+		Pull out all the edge pixels in one go, and colour correct them.
+		The result is reused by the next call.
+		"""
+		return self.colour_corrector.correct(self.edge_extractor.extract(pixel_array, black_top, black_bottom, black_left, black_right))
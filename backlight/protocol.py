@@ -0,0 +1,303 @@
+# Builds the UDP packets understood by the TVBacklight sketch.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import struct
+import numpy
+
+# Packet types, the first byte of each packet.
+PACKET_INPUT = b'I'
+PACKET_PIXELS = b'P'
+PACKET_DELTA = b'D'
+PACKET_PACKED = b'R'
+PACKET_FRAGMENT = b'F'
+
+# 'I', input number, uint32 0x00RRGGBB colour to fill the strip with.
+INPUT_PACKET = struct.Struct('<cBI')
+
+# 'P', input number, uint16 number of pixels.
+PIXEL_HEADER = struct.Struct('<cBH')
+
+# 'R', input number, format version, uint16 number of pixels.
+PACKED_HEADER = struct.Struct('<cBBH')
+
+# Version 1 of the packed format is three bytes per pixel, red, green, blue.
+PACKED_VERSION = 1
+
+# 'D', input number, uint8 number of runs.
+DELTA_HEADER = struct.Struct('<cBB')
+
+# Each run in a delta packet: uint16 first pixel, uint8 number of pixels.
+DELTA_RUN_HEADER = struct.Struct('<HB')
+DELTA_RUN_MAX = 255
+
+# 'F', input number, uint8 frame sequence, uint8 bytes per pixel,
+# uint16 pixels in the frame, uint16 first pixel, uint16 pixels in this packet.
+FRAGMENT_HEADER = struct.Struct('<cBBBHHH')
+
+# The size of the sketch's packet buffer. Anything past this is dropped.
+PACKET_MAX_SIZE = 600
+
+# Optionally added to the end of each packet, for measuring with the
+# emulator: magic, uint32 packet number, double time sent. The sketch never
+# reads past the pixels it was told about, so it ignores this.
+TRAILER = struct.Struct('<4sId')
+TRAILER_MAGIC = b'BLt1'
+
+def read_trailer(packet):
+	"""
+	Return the (packet number, time sent) from the end of a packet, or
+	None if it doesn't have a trailer.
+	"""
+	if len(packet) < TRAILER.size:
+		return None
+	magic, number, sent = TRAILER.unpack_from(packet, len(packet) - TRAILER.size)
+	if magic != TRAILER_MAGIC:
+		return None
+	return number, sent
+
+def input_packet(inp, colour = 0):
+	"""
+	Return the packet that switches the sketch to inp, and fills the strip
+	with colour until pixels for that input arrive.
+	"""
+	return INPUT_PACKET.pack(PACKET_INPUT, inp, colour)
+
+class PixelPacket(object):
+	"""
+	A reusable pixel packet. The buffer is allocated once with the header
+	written into it, and each frame only overwrites the pixel data. Each
+	pixel is sent as a little endian 0x00RRGGBB word, which is B, G, R, 0
+	on the wire.
+	"""
+
+	def __init__(self, inp, pixel_count):
+		self.pixel_count = pixel_count
+		self.buffer = bytearray(PIXEL_HEADER.size + (pixel_count * 4))
+		PIXEL_HEADER.pack_into(self.buffer, 0, PACKET_PIXELS, inp, pixel_count)
+
+		# A view of the pixel data, to write the frames straight into.
+		self.words = numpy.frombuffer(self.buffer, dtype = numpy.uint8, offset = PIXEL_HEADER.size)
+		self.words = self.words.reshape(pixel_count, 4)
+		self.view = memoryview(self.buffer)
+
+	def set_input(self, inp):
+		self.buffer[1] = inp
+
+	def pack(self, rgb):
+		"""
+		Write a (pixel_count, 3) RGB array into the packet, and return
+		a list holding a view of the whole packet, ready to send.
+		"""
+		self.words[:, :3] = rgb[:, ::-1]
+		return [self.view]
+
+class PackedPixelPacket(object):
+	"""
+	A reusable packed pixel packet, which sends each pixel as three bytes
+	rather than a four byte word, so it's a quarter smaller than a
+	PixelPacket and fits 198 pixels in the sketch's buffer.
+	"""
+
+	def __init__(self, inp, pixel_count):
+		self.pixel_count = pixel_count
+		self.buffer = bytearray(PACKED_HEADER.size + (pixel_count * 3))
+		PACKED_HEADER.pack_into(self.buffer, 0, PACKET_PACKED, inp, PACKED_VERSION, pixel_count)
+
+		# A view of the pixel data, which is laid out exactly like the
+		# RGB arrays, so each frame is a single copy.
+		self.rgb = numpy.frombuffer(self.buffer, dtype = numpy.uint8, offset = PACKED_HEADER.size)
+		self.rgb = self.rgb.reshape(pixel_count, 3)
+		self.view = memoryview(self.buffer)
+
+	def set_input(self, inp):
+		self.buffer[1] = inp
+
+	def pack(self, rgb):
+		"""
+		Write a (pixel_count, 3) RGB array into the packet, and return
+		a list holding a view of the whole packet, ready to send.
+		"""
+		self.rgb[...] = rgb
+		return [self.view]
+
+class FragmentedPacket(object):
+	"""
+	Splits a frame that is too big for one packet across several 'F'
+	packets, each of which says where its pixels go and which frame they
+	belong to. The sketch shows the frame once it has all the pixels, or
+	when the next frame starts.
+	"""
+
+	def __init__(self, inp, pixel_count, max_size = PACKET_MAX_SIZE, packed = False):
+		self.pixel_count = pixel_count
+		self.packed = packed
+		if packed:
+			self.bytes_per_pixel = 3
+		else:
+			self.bytes_per_pixel = 4
+		self.sequence = 0
+
+		chunk_pixels = (max_size - FRAGMENT_HEADER.size) // self.bytes_per_pixel
+		if chunk_pixels < 1:
+			raise ValueError("Packet size %d is too small to hold any pixels." % max_size)
+
+		# One buffer per packet, with the header written in, and a view of
+		# the pixel data in each.
+		self.buffers = []
+		self.chunks = []
+		self.views = []
+		for first in range(0, pixel_count, chunk_pixels):
+			count = min(chunk_pixels, pixel_count - first)
+			buf = bytearray(FRAGMENT_HEADER.size + (count * self.bytes_per_pixel))
+			FRAGMENT_HEADER.pack_into(buf, 0, PACKET_FRAGMENT, inp, 0, self.bytes_per_pixel, pixel_count, first, count)
+			data = numpy.frombuffer(buf, dtype = numpy.uint8, offset = FRAGMENT_HEADER.size)
+			self.buffers.append(buf)
+			self.chunks.append((first, count, data.reshape(count, self.bytes_per_pixel)))
+			self.views.append(memoryview(buf))
+
+		self.size = sum(len(buf) for buf in self.buffers)
+
+	def set_input(self, inp):
+		for buf in self.buffers:
+			buf[1] = inp
+
+	def pack(self, rgb):
+		"""
+		Write a (pixel_count, 3) RGB array into the packets, and return
+		a list of views of them, ready to send.
+		"""
+		self.sequence = (self.sequence + 1) & 0xFF
+		for buf in self.buffers:
+			buf[2] = self.sequence
+
+		for first, count, data in self.chunks:
+			if self.packed:
+				data[...] = rgb[first:first + count]
+			else:
+				data[:, :3] = rgb[first:first + count, ::-1]
+		return self.views
+
+def frame_packet(inp, pixel_count, max_size = PACKET_MAX_SIZE, packed = False):
+	"""
+	Return the packet to send whole frames with, which is split into
+	fragments if the frame won't fit in one packet.
+	"""
+	if packed:
+		packet = PackedPixelPacket(inp, pixel_count)
+	else:
+		packet = PixelPacket(inp, pixel_count)
+
+	if len(packet.buffer) > max_size:
+		packet = FragmentedPacket(inp, pixel_count, max_size, packed)
+		print "%d pixels don't fit in a %d byte packet, so each frame is split over %d packets." % (pixel_count, max_size, len(packet.buffers))
+	return packet
+
+class DeltaPacket(object):
+	"""
+	Sends only the runs of pixels that have changed by more than the
+	threshold since they were last sent, as 'D' packets. A full keyframe
+	(a 'P' packet, or an 'R' packet if packed) is sent every
+	keyframe_interval frames to recover from lost packets, or whenever
+	the delta would be no smaller than the full frame.
+	"""
+
+	def __init__(self, inp, pixel_count, threshold = 2, keyframe_interval = 30, max_size = PACKET_MAX_SIZE, packed = False):
+		self.pixel_count = pixel_count
+		self.threshold = threshold
+		self.keyframe_interval = keyframe_interval
+		self.keyframe = frame_packet(inp, pixel_count, max_size, packed)
+		if isinstance(self.keyframe, FragmentedPacket):
+			self.max_size = max_size
+		else:
+			self.max_size = len(self.keyframe.buffer)
+		self.frames_since_keyframe = None
+
+		# What the controller should currently be showing.
+		self.sent = numpy.zeros((pixel_count, 3), dtype = numpy.int16)
+
+		self.buffer = bytearray(self.max_size)
+		DELTA_HEADER.pack_into(self.buffer, 0, PACKET_DELTA, inp, 0)
+		self.view = memoryview(self.buffer)
+
+		# The whole buffer as bytes, so runs can be written into it
+		# wherever they land.
+		self.bytes = numpy.frombuffer(self.buffer, dtype = numpy.uint8)
+
+	def set_input(self, inp):
+		self.keyframe.set_input(inp)
+		self.buffer[1] = inp
+		# The other input has left the strip showing who knows what.
+		self.resend()
+
+	def resend(self):
+		"""
+		Send a keyframe next, because the controller might not have got
+		what was sent before.
+		"""
+		self.frames_since_keyframe = None
+
+	def changed_runs(self, rgb):
+		"""
+		Return the (first, count) runs of pixels that have changed, with
+		runs split so that none is longer than a run can hold.
+		"""
+		difference = numpy.abs(rgb - self.sent).max(axis = 1)
+		changed = numpy.concatenate(([0], difference > self.threshold, [0])).astype(numpy.int8)
+		edges = numpy.diff(changed)
+		starts = numpy.flatnonzero(edges == 1)
+		ends = numpy.flatnonzero(edges == -1)
+
+		runs = []
+		for start, end in zip(starts.tolist(), ends.tolist()):
+			while end - start > DELTA_RUN_MAX:
+				runs.append((start, DELTA_RUN_MAX))
+				start += DELTA_RUN_MAX
+			runs.append((start, end - start))
+		return runs
+
+	def pack(self, rgb):
+		"""
+		Work out what has changed in the (pixel_count, 3) RGB array, and
+		return a list of views of the packets to send, which is empty if
+		nothing needs sending this frame.
+		"""
+		if self.frames_since_keyframe is not None and self.frames_since_keyframe < self.keyframe_interval:
+			runs = self.changed_runs(rgb)
+			if not runs:
+				self.frames_since_keyframe += 1
+				return []
+
+			size = DELTA_HEADER.size + sum(DELTA_RUN_HEADER.size + (count * 4) for first, count in runs)
+			if size < self.max_size and len(runs) <= 255:
+				self.frames_since_keyframe += 1
+				return self.pack_runs(rgb, runs, size)
+
+		self.frames_since_keyframe = 0
+		self.sent[...] = rgb
+		return self.keyframe.pack(rgb)
+
+	def pack_runs(self, rgb, runs, size):
+		self.buffer[2] = len(runs)
+		offset = DELTA_HEADER.size
+		for first, count in runs:
+			DELTA_RUN_HEADER.pack_into(self.buffer, offset, first, count)
+			offset += DELTA_RUN_HEADER.size
+			words = self.bytes[offset:offset + (count * 4)].reshape(count, 4)
+			words[:, :3] = rgb[first:first + count, ::-1]
+			words[:, 3] = 0
+			offset += count * 4
+			self.sent[first:first + count] = rgb[first:first + count]
+		return [self.view[:size]]
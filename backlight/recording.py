@@ -0,0 +1,213 @@
+# Records the packets sent to the controller, for replaying later.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import ctypes
+import ctypes.util
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+import numpy
+
+# A recording starts with a fixed size header, then a preallocated index
+# with an entry for each packet, and then the packets themselves, back to
+# back. The header is: magic, version, index capacity, packet count, space
+# for packets in bytes, and the wall clock time the recording started.
+HEADER = struct.Struct('<4sHxxIIQd')
+MAGIC = b'TVBr'
+VERSION = 1
+
+# Where the packet count is in the header, so it can be updated by itself.
+COUNT = struct.Struct('<I')
+COUNT_OFFSET = 12
+
+# Each packet's time (in seconds since the recording started), where it
+# is in the packets area, and its length.
+INDEX = numpy.dtype([('time', '<f8'), ('offset', '<u8'), ('length', '<u4')])
+
+# How much of the file goes to the index: an entry per this many bytes,
+# which is room for a lot more packets than will fit, unless they're tiny.
+BYTES_PER_ENTRY = 256
+
+class RecordingError(Exception):
+	pass
+
+class timespec(ctypes.Structure):
+	_fields_ = [
+		('tv_sec', ctypes.c_long),
+		('tv_nsec', ctypes.c_long),
+	]
+
+# The id of CLOCK_MONOTONIC, which isn't the same everywhere.
+if sys.platform == 'darwin':
+	CLOCK_MONOTONIC = 6
+else:
+	CLOCK_MONOTONIC = 1
+
+def monotonic_clock():
+	"""
+	Return a function that returns the time in seconds from a clock that
+	isn't affected by the system time being set, if there is one. Otherwise
+	(on OSX before 10.12), fall back to the time of day.
+	"""
+	try:
+		clock_gettime = ctypes.CDLL(ctypes.util.find_library('c')).clock_gettime
+	except (OSError, AttributeError):
+		return time.time
+
+	clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+	clock_gettime.restype = ctypes.c_int
+	now = timespec()
+
+	# Make sure the clock works here, rather than recording every packet
+	# at time 0.
+	if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(now)) != 0:
+		return time.time
+
+	def monotonic():
+		clock_gettime(CLOCK_MONOTONIC, ctypes.byref(now))
+		return now.tv_sec + (now.tv_nsec / 1e9)
+
+	return monotonic
+
+class PacketRecorder(object):
+	"""
+	Writes every packet sent to a memory mapped file of a fixed size, so
+	that the memory used doesn't grow however long it runs. Once the file
+	is full, no more packets are recorded. Senders on several threads can
+	share a recorder.
+	"""
+
+	def __init__(self, path, size):
+		self.path = path
+		self.capacity = size // BYTES_PER_ENTRY
+		self.data_start = HEADER.size + (self.capacity * INDEX.itemsize)
+		self.data_size = size - self.data_start
+		if self.data_size <= 0:
+			raise RecordingError("A recording of %d bytes is too small." % size)
+
+		self.file = open(path, 'w+b')
+		self.file.truncate(size)
+		self.map = mmap.mmap(self.file.fileno(), size)
+		self.index = numpy.frombuffer(self.map, INDEX, self.capacity, HEADER.size)
+		self.data = numpy.frombuffer(self.map, numpy.uint8, self.data_size, self.data_start)
+
+		self.clock = monotonic_clock()
+		self.started = self.clock()
+		self.count = 0
+		self.used = 0
+		self.full = False
+		self.lock = threading.Lock()
+
+		HEADER.pack_into(self.map, 0, MAGIC, VERSION, self.capacity, 0, self.data_size, time.time())
+
+	def record(self, message):
+		"""
+		Add a packet, which can be a string or a memoryview.
+		"""
+		now = self.clock() - self.started
+		length = len(message)
+		with self.lock:
+			if self.map is None:
+				return
+			if self.count == self.capacity or self.used + length > self.data_size:
+				if not self.full:
+					print "The recording in %s is full; no more packets will be recorded." % self.path
+					self.full = True
+				return
+
+			self.data[self.used:self.used + length] = numpy.asarray(memoryview(message))
+			self.index[self.count] = (now, self.used, length)
+			self.count += 1
+			self.used += length
+
+			# Written last, so that a recording cut off by a crash only
+			# counts the packets that made it in.
+			COUNT.pack_into(self.map, COUNT_OFFSET, self.count)
+
+	def close(self):
+		"""
+		Finish the recording, and cut the file down to the packets in it.
+		"""
+		with self.lock:
+			if self.map is None:
+				return
+			self.index = None
+			self.data = None
+			self.map.flush()
+			self.map.close()
+			self.map = None
+			self.file.truncate(self.data_start + self.used)
+			self.file.close()
+
+class Recording(object):
+	"""
+	A recording to read back. Only the parts being read are loaded, so
+	recordings bigger than memory are fine.
+	"""
+
+	def __init__(self, path):
+		self.file = open(path, 'rb')
+		size = os.fstat(self.file.fileno()).st_size
+		if size < HEADER.size:
+			raise RecordingError("%s is too short to be a recording." % path)
+		self.map = mmap.mmap(self.file.fileno(), size, access = mmap.ACCESS_READ)
+
+		magic, version, capacity, self.count, data_size, self.started = HEADER.unpack_from(self.map, 0)
+		if magic != MAGIC:
+			raise RecordingError("%s is not a recording." % path)
+		if version != VERSION:
+			raise RecordingError("%s is a version %d recording, which this can't read." % (path, version))
+
+		self.index = numpy.frombuffer(self.map, INDEX, self.count, HEADER.size)
+		self.data_start = HEADER.size + (capacity * INDEX.itemsize)
+
+	def __len__(self):
+		return self.count
+
+	@property
+	def duration(self):
+		if self.count == 0:
+			return 0.0
+		return float(self.index['time'][-1])
+
+	def packets(self, start = 0.0):
+		"""
+		Generate (time, packet) for each packet, from start seconds in.
+		"""
+		first = numpy.searchsorted(self.index['time'], start)
+		for number in xrange(first, self.count):
+			when, offset, length = self.index[number].item()
+			offset += self.data_start
+			yield when, self.map[offset:offset + length]
+
+	def close(self):
+		self.index = None
+		self.map.close()
+		self.file.close()
+
+def packet_recorder(configuration):
+	"""
+	Start recording to record_file, if it is set.
+	"""
+	if not configuration['record_file']:
+		return None
+	recorder = PacketRecorder(configuration['record_file'], configuration['record_megabytes'] * 1024 * 1024)
+	print "Recording the packets sent to %s." % configuration['record_file']
+	return recorder
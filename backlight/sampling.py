@@ -0,0 +1,119 @@
+# Works out which screen pixels make up each pixel of the scaled down image.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy
+
+def zone_average(samples, depth, out = None):
+	"""
+	Average each depth x depth block of a (height * depth, width * depth, 3)
+	array of samples, giving a (height, width, 3) array.
+	"""
+	if depth == 1:
+		return samples
+
+	rows, columns, channels = samples.shape
+	height = rows // depth
+	width = columns // depth
+	if out is None:
+		out = numpy.zeros((height, width, channels), dtype = numpy.uint8)
+
+	blocks = samples.reshape(height, depth, width, depth, channels)
+	total = blocks.sum(axis = 3, dtype = numpy.uint32).sum(axis = 1)
+	numpy.floor_divide(total, depth * depth, out = out, casting = 'unsafe')
+	return out
+
+class SampleGrid(object):
+	"""
+	Maps each pixel of the width x height scaled down image back to the
+	screen pixels it comes from. Knowing this up front means we only need
+	to capture and touch the screen pixels that will actually be used.
+
+	With a depth of 1 this is nearest neighbour scaling, and each pixel
+	comes from the one screen pixel in the middle of its zone of the
+	screen. With a larger depth, each pixel is the average of a depth x
+	depth grid of samples across its zone, which gives much steadier
+	colours than a single pixel. The samples are spread evenly across the
+	zone, or are stride screen pixels apart around its middle.
+	"""
+
+	def __init__(self, screen_width, screen_height, width, height, depth = 1, stride = None):
+		self.screen_width = screen_width
+		self.screen_height = screen_height
+		self.width = width
+		self.height = height
+		self.depth = depth
+		self.stride = stride
+
+		# The screen columns and rows to sample, depth of them for each
+		# column and row of the scaled down image, in order.
+		self.xs = self.positions(screen_width, width)
+		self.ys = self.positions(screen_height, height)
+
+		# Reused for the result of each frame.
+		self.scaled = numpy.zeros((height, width, 3), dtype = numpy.uint8)
+
+	def positions(self, screen_size, size):
+		zone = float(screen_size) / size
+		starts = numpy.arange(size) * zone
+
+		if self.stride is None:
+			offsets = (numpy.arange(self.depth) + 0.5) * (zone / self.depth)
+		else:
+			offsets = (zone / 2) + ((numpy.arange(self.depth) - ((self.depth - 1) / 2.0)) * self.stride)
+			offsets = numpy.clip(offsets, 0, zone - 1)
+
+		positions = (starts[:, numpy.newaxis] + offsets).astype(numpy.intp).ravel()
+		return numpy.clip(positions, 0, screen_size - 1)
+
+	def band(self, count, size):
+		band = set(range(min(count, size)))
+		band.update(range(max(size - count, 0), size))
+		return numpy.array(sorted(band), dtype = numpy.intp)
+
+	def band_rows(self, rows):
+		"""
+		Return the rows of the scaled down image that are within the given
+		number of rows of the top or bottom, which is where the edges and
+		the black bars can be.
+		"""
+		return self.band(rows, self.height)
+
+	def band_columns(self, columns):
+		"""
+		The same as band_rows, for the columns at the left and right.
+		"""
+		return self.band(columns, self.width)
+
+	def sample_indexes(self, indexes):
+		"""
+		Return the positions in xs or ys of the samples for the given
+		columns or rows of the scaled down image.
+		"""
+		indexes = numpy.asarray(indexes, dtype = numpy.intp)
+		return ((indexes[:, numpy.newaxis] * self.depth) + numpy.arange(self.depth)).ravel()
+
+	def reduce(self, samples):
+		"""
+		Turn a (height * depth, width * depth, 3) array of samples into the
+		scaled down image.
+		"""
+		return zone_average(samples, self.depth, self.scaled)
+
+	def sample(self, pixel_array):
+		"""
+		Scale down a full size (screen_height, screen_width, 3) array.
+		"""
+		return self.reduce(pixel_array[self.ys[:, numpy.newaxis], self.xs])
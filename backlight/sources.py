@@ -0,0 +1,178 @@
+# Captures several sources at once, each in a process of its own.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import ctypes
+import multiprocessing
+import select
+import time
+
+import numpy
+
+from backlight.capture import CaptureFinished
+from backlight.edges import LedLayout
+from backlight.metrics import Metrics
+from backlight.network import sender_for
+
+# The timings of the steps done in the worker processes, which are handed
+# back with each frame.
+WORKER_STAGES = ['cap', 'scale', 'search', 'proc']
+
+def source_settings(configuration, source):
+	"""
+	Return the settings for one of the sources: the top level ones, with
+	any the source sets itself instead.
+	"""
+	settings = dict(configuration)
+	settings.update(source)
+	settings['sources'] = []
+	return settings
+
+def run_worker(worker, number, settings, shared, lock, connection):
+	"""
+	Run worker(number, settings, publish) in the worker process, until the
+	capture runs out or fails. publish() puts each frame's edge pixels in
+	the shared memory and lets the main process know.
+	"""
+	edges = numpy.frombuffer(shared, dtype = numpy.uint8).reshape(-1, 3)
+
+	def publish(frame):
+		with lock:
+			edges[...] = frame['edges']
+		connection.send((frame['start'], frame['skipped']) + tuple(frame[stage] for stage in WORKER_STAGES))
+
+	try:
+		worker(number, settings, publish)
+	except KeyboardInterrupt:
+		pass
+	except CaptureFinished, ex:
+		connection.send("stopped at %s." % ex)
+	except Exception, ex:
+		connection.send("failed: %s." % str(ex).rstrip('.'))
+
+class SourceProcess(object):
+	"""
+	One source, captured and processed by a worker process of its own, so
+	that several sources use several cores. Only the edge pixels come
+	back, through shared memory, rather than pickling anything the size
+	of a frame; the sending is done here.
+	"""
+
+	def __init__(self, number, settings, worker, recorder = None):
+		self.number = number
+		self.settings = settings
+		self.pixel_count = LedLayout(settings['size_x'], settings['size_y'], settings['layout']).pixel_count
+		self.sender = sender_for(settings, self.pixel_count, recorder)
+
+		self.shared = multiprocessing.RawArray(ctypes.c_uint8, self.pixel_count * 3)
+		self.edges = numpy.frombuffer(self.shared, dtype = numpy.uint8).reshape(self.pixel_count, 3)
+		self.rgb = numpy.zeros((self.pixel_count, 3), dtype = numpy.uint8)
+		self.lock = multiprocessing.Lock()
+
+		# Frames that came in while we were busy, and were never sent, and
+		# those the worker skipped as unchanged.
+		self.dropped = 0
+		self.skipped = 0
+		self.last_sent = time.time()
+		self.last_summary = self.last_sent
+
+		self.metrics = Metrics(WORKER_STAGES + ['send', 'total'])
+		self.metrics.add_source('send_errors', lambda: self.sender.errors)
+		self.metrics.add_source('network_outages', lambda: self.sender.outages)
+		self.metrics.add_source('dropped_frames', lambda: self.dropped)
+		self.metrics.add_source('skipped_frames', lambda: self.skipped)
+
+		self.connection, child = multiprocessing.Pipe(False)
+		self.process = multiprocessing.Process(target = run_worker, args = (worker, number, settings, self.shared, self.lock, child))
+		self.process.daemon = True
+		self.process.start()
+		child.close()
+
+	def fileno(self):
+		return self.connection.fileno()
+
+	def receive(self):
+		"""
+		Send the latest frame from the worker, dropping any older ones that
+		came in meanwhile. Returns False once the worker has stopped.
+		"""
+		latest = None
+		try:
+			while self.connection.poll():
+				message = self.connection.recv()
+				if isinstance(message, str):
+					print "Source %d: %s" % (self.number, message)
+				else:
+					if latest is not None:
+						self.dropped += 1
+					latest = message
+		except EOFError:
+			return False
+
+		if latest is not None:
+			self.send(latest)
+		return True
+
+	def send(self, timings):
+		start, self.skipped = timings[:2]
+		with self.lock:
+			self.rgb[...] = self.edges
+		sendtime = time.time()
+		self.sender.send(self.rgb)
+		end = time.time()
+
+		for stage, taken in zip(WORKER_STAGES, timings[2:]):
+			self.metrics.record(stage, taken)
+		self.metrics.record('send', end - sendtime)
+		self.metrics.record('total', end - start)
+		self.metrics.increment('frames')
+
+		if not self.settings['summary_seconds']:
+			print "Source %d: Total time %0.4fs. Cap %0.4fs, Scale %0.4fs, Search %0.4fs, Proc %0.4fs, Send %0.4fs, FPS %0.2f, Dropped %d, Skipped %d" % (
+				(self.number, end - start) + timings[2:] + (end - sendtime, 1 / max(end - self.last_sent, 0.0001), self.dropped, self.skipped)
+			)
+		elif end - self.last_summary >= self.settings['summary_seconds']:
+			print "Source %d: %s" % (self.number, self.metrics.summary())
+			self.last_summary = end
+		self.last_sent = end
+
+	def close(self):
+		self.process.terminate()
+		self.sender.close()
+
+def run_sources(configuration, worker, recorder = None):
+	"""
+	Start a worker process for each of the sources in
+	configuration['sources'], which runs worker(number, settings, publish)
+	to capture and process that source, and send their frames as they
+	come in, until they've all stopped.
+	"""
+	sources = []
+	try:
+		for number, source in enumerate(configuration['sources']):
+			settings = source_settings(configuration, source)
+			sources.append(SourceProcess(number, settings, worker, recorder))
+			print "Source %d: sending %d pixels each screen to input %d." % (number, sources[-1].pixel_count, settings['input'])
+
+		while sources:
+			for source in select.select(sources, [], [])[0]:
+				if not source.receive():
+					source.close()
+					sources.remove(source)
+	except KeyboardInterrupt:
+		pass
+	finally:
+		for source in sources:
+			source.close()
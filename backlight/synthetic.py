@@ -0,0 +1,81 @@
+# Synthetic screens, for benchmarking and testing without a display.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+
+import numpy
+
+# The kinds of screen that can be made up.
+WORKLOADS = ['static', 'noise', 'letterbox', 'pillarbox', 'scrolling']
+
+# A handful of frames is enough to keep the caches honest, without
+# spending all the time and memory making them up at 4K.
+POOL_SIZE = 8
+
+def gradient(width, height):
+	"""
+	A smooth colour gradient, a stand in for a still picture.
+	"""
+	frame = numpy.zeros((height, width, 3), dtype = numpy.uint8)
+	frame[:, :, 0] = numpy.linspace(0, 255, width).astype(numpy.uint8)
+	frame[:, :, 1] = numpy.linspace(0, 255, height).astype(numpy.uint8)[:, numpy.newaxis]
+	frame[:, :, 2] = 128
+	return frame
+
+def noise(random, width, height):
+	return random.randint(0, 256, (height, width, 3)).astype(numpy.uint8)
+
+def frames(workload, width, height, seed = 0):
+	"""
+	Return an endless iterator of (height, width, 3) uint8 frames of the
+	given workload. The frames are reused, so don't write to them.
+	"""
+	random = numpy.random.RandomState(seed)
+
+	if workload == 'static':
+		return itertools.repeat(gradient(width, height))
+
+	if workload == 'noise':
+		return itertools.cycle([noise(random, width, height) for i in range(POOL_SIZE)])
+
+	if workload == 'letterbox':
+		# A 2.39:1 movie on a 16:9 screen, with black bars above and below.
+		bar = (height - int(width / 2.39)) // 2
+		pool = []
+		for i in range(POOL_SIZE):
+			frame = numpy.zeros((height, width, 3), dtype = numpy.uint8)
+			frame[bar:height - bar] = noise(random, width, height - (bar * 2))
+			pool.append(frame)
+		return itertools.cycle(pool)
+
+	if workload == 'pillarbox':
+		# A 4:3 picture on a 16:9 screen, with black bars at the sides.
+		bar = (width - ((height * 4) // 3)) // 2
+		pool = []
+		for i in range(POOL_SIZE):
+			frame = numpy.zeros((height, width, 3), dtype = numpy.uint8)
+			frame[:, bar:width - bar] = noise(random, width - (bar * 2), height)
+			pool.append(frame)
+		return itertools.cycle(pool)
+
+	if workload == 'scrolling':
+		# A window sliding down a taller picture, like scrolling a page.
+		# Each frame is a view, so nothing is copied.
+		step = max(height // 60, 1)
+		page = numpy.concatenate([gradient(width, height), noise(random, width, height)])
+		return (page[offset:offset + height] for offset in itertools.cycle(range(0, height, step)))
+
+	raise ValueError("Unknown workload %s." % workload)
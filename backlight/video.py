@@ -0,0 +1,220 @@
+# Reads video files frame by frame, to stand in for the screen.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mmap
+import os
+
+import numpy
+
+Y4M_MAGIC = 'YUV4MPEG2 '
+Y4M_FRAME = 'FRAME'
+
+# How much smaller the chroma planes are than the picture, across and
+# down, for each Y4M colour space. Mono has none.
+Y4M_SUBSAMPLING = {
+	'420': (2, 2),
+	'420jpeg': (2, 2),
+	'420mpeg2': (2, 2),
+	'420paldv': (2, 2),
+	'411': (4, 1),
+	'422': (2, 1),
+	'444': (1, 1),
+	'mono': None,
+}
+
+# Y, U and V to R, G and B (BT.601), for video levels (16 to 235) and full
+# range (0 to 255).
+YUV_LIMITED = numpy.array([
+	[1.164, 0.0, 1.596],
+	[1.164, -0.392, -0.813],
+	[1.164, 2.017, 0.0],
+])
+YUV_FULL = numpy.array([
+	[1.0, 0.0, 1.402],
+	[1.0, -0.344136, -0.714136],
+	[1.0, 1.772, 0.0],
+])
+
+class VideoError(Exception):
+	pass
+
+def parse_size(value):
+	"""
+	Parse a size like 1920x1080.
+	"""
+	try:
+		width, height = [int(part) for part in value.lower().split('x')]
+	except (AttributeError, ValueError):
+		raise VideoError("%s isn't a size like 1920x1080." % (value,))
+	return width, height
+
+class VideoFile(object):
+	"""
+	A video file, memory mapped so that only the parts of each frame that
+	are looked at are read in. frames() generates each frame in turn as
+	views of the file, without copying them, and sample() turns the
+	samples that are wanted from a frame into RGB.
+	"""
+
+	# The (width, height) of the picture, and the frames per second if the
+	# file says.
+	size = (0, 0)
+	rate = None
+
+	def __init__(self, path):
+		self.file = open(path, 'rb')
+		length = os.fstat(self.file.fileno()).st_size
+		if length == 0:
+			raise VideoError("%s is empty." % path)
+		self.map = mmap.mmap(self.file.fileno(), length, access = mmap.ACCESS_READ)
+
+	def view(self, offset, shape):
+		"""
+		Return the part of the file at offset as a uint8 array of shape.
+		"""
+		return numpy.frombuffer(self.map, numpy.uint8, numpy.prod(shape), offset).reshape(shape)
+
+	def frames(self, loop = False):
+		"""
+		Generate the frames, from the start again once they run out if
+		loop is set.
+		"""
+		while True:
+			found = False
+			for frame in self.read_frames():
+				found = True
+				yield frame
+			if not loop or not found:
+				return
+
+	def read_frames(self):
+		raise NotImplementedError()
+
+	def sample(self, frame, ys, xs):
+		"""
+		Return the pixels of the frame at rows ys and columns xs, as a
+		(len(ys), len(xs), 3) RGB array.
+		"""
+		raise NotImplementedError()
+
+	def close(self):
+		self.map.close()
+		self.file.close()
+
+class RawVideo(VideoFile):
+	"""
+	Frames of packed 8 bit RGB, one after the other with nothing in
+	between, as ffmpeg -f rawvideo -pix_fmt rgb24 writes them. The file
+	doesn't say how big the frames are, so that has to be given.
+	"""
+
+	def __init__(self, path, size):
+		VideoFile.__init__(self, path)
+		self.size = size
+		self.frame_size = size[0] * size[1] * 3
+		if len(self.map) < self.frame_size:
+			raise VideoError("%s is smaller than one %dx%d frame." % (path, size[0], size[1]))
+
+	def read_frames(self):
+		shape = (self.size[1], self.size[0], 3)
+		for offset in xrange(0, len(self.map) - self.frame_size + 1, self.frame_size):
+			yield self.view(offset, shape)
+
+	def sample(self, frame, ys, xs):
+		return frame[ys[:, numpy.newaxis], xs]
+
+class Y4MVideo(VideoFile):
+	"""
+	A YUV4MPEG2 file, as ffmpeg and most other tools can write. The
+	frames are kept as their Y, U and V planes, and only the samples that
+	are used are converted to RGB.
+	"""
+
+	def __init__(self, path):
+		VideoFile.__init__(self, path)
+		end = self.map.find('\n')
+		header = self.map[:end] if end >= 0 else ''
+		if not header.startswith(Y4M_MAGIC):
+			raise VideoError("%s is not a Y4M file." % path)
+		self.start = end + 1
+
+		parameters = dict((token[0], token[1:]) for token in header[len(Y4M_MAGIC):].split())
+		try:
+			self.size = (int(parameters['W']), int(parameters['H']))
+		except (KeyError, ValueError):
+			raise VideoError("%s doesn't give the frame size." % path)
+
+		if 'F' in parameters:
+			numerator, denominator = [int(part) for part in parameters['F'].split(':')]
+			if numerator and denominator:
+				self.rate = float(numerator) / denominator
+
+		colourspace = parameters.get('C', '420jpeg')
+		if colourspace not in Y4M_SUBSAMPLING:
+			raise VideoError("Y4M colour space %s isn't supported, only 8 bit %s." % (colourspace, ', '.join(sorted(Y4M_SUBSAMPLING))))
+		self.subsampling = Y4M_SUBSAMPLING[colourspace]
+
+		# Y4M doesn't normally say, but most video is video levels.
+		full = parameters.get('X') == 'COLORRANGE=FULL'
+		self.matrix = YUV_FULL if full else YUV_LIMITED
+		self.black = 0 if full else 16
+
+		width, height = self.size
+		self.planes = [(0, (height, width))]
+		if self.subsampling:
+			across, down = self.subsampling
+			chroma = (-(-height // down), -(-width // across))
+			self.planes.append((width * height, chroma))
+			self.planes.append((width * height + (chroma[0] * chroma[1]), chroma))
+		self.frame_size = sum(shape[0] * shape[1] for offset, shape in self.planes)
+
+	def read_frames(self):
+		offset = self.start
+		while True:
+			end = self.map.find('\n', offset)
+			if end < 0 or end + 1 + self.frame_size > len(self.map):
+				return
+			if not self.map[offset:end].startswith(Y4M_FRAME):
+				raise VideoError("Expected a frame at byte %d." % offset)
+			data = end + 1
+			yield [self.view(data + plane, shape) for plane, shape in self.planes]
+			offset = data + self.frame_size
+
+	def sample(self, frame, ys, xs):
+		rows = ys[:, numpy.newaxis]
+		yuv = numpy.empty((len(ys), len(xs), 3))
+		yuv[:, :, 0] = frame[0][rows, xs]
+		yuv[:, :, 0] -= self.black
+		if self.subsampling:
+			across, down = self.subsampling
+			yuv[:, :, 1] = frame[1][rows // down, xs // across]
+			yuv[:, :, 2] = frame[2][rows // down, xs // across]
+			yuv[:, :, 1:] -= 128
+		else:
+			yuv[:, :, 1:] = 0
+		rgb = numpy.dot(yuv, self.matrix.T)
+		return numpy.clip(rgb + 0.5, 0, 255).astype(numpy.uint8)
+
+def open_video(path, size = None):
+	"""
+	Open a Y4M file (by its .y4m extension), or otherwise a file of raw RGB
+	frames of the given size, like "1920x1080".
+	"""
+	if path.lower().endswith('.y4m'):
+		return Y4MVideo(path)
+	if not size:
+		raise VideoError("Raw RGB video needs video_size to be set, like 1920x1080.")
+	return RawVideo(path, parse_size(size))
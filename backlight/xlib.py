@@ -0,0 +1,216 @@
+# Minimal ctypes bindings for the bits of Xlib and its extensions that we use.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import ctypes
+import ctypes.util
+
+# Xlib constants.
+ZPixmap = 2
+AllPlanes = 0xFFFFFFFF
+
+# XDamage constants.
+XDamageReportRawRectangles = 0
+XDamageNotify = 0
+
+# System V shared memory constants.
+IPC_PRIVATE = 0
+IPC_CREAT = 0o1000
+IPC_RMID = 0
+
+class XError(Exception):
+	pass
+
+class XImage(ctypes.Structure):
+	# Only the fields we need; the rest of the structure is never touched.
+	_fields_ = [
+		('width', ctypes.c_int),
+		('height', ctypes.c_int),
+		('xoffset', ctypes.c_int),
+		('format', ctypes.c_int),
+		('data', ctypes.c_void_p),
+		('byte_order', ctypes.c_int),
+		('bitmap_unit', ctypes.c_int),
+		('bitmap_bit_order', ctypes.c_int),
+		('bitmap_pad', ctypes.c_int),
+		('depth', ctypes.c_int),
+		('bytes_per_line', ctypes.c_int),
+		('bits_per_pixel', ctypes.c_int),
+		('red_mask', ctypes.c_ulong),
+		('green_mask', ctypes.c_ulong),
+		('blue_mask', ctypes.c_ulong),
+	]
+
+class XShmSegmentInfo(ctypes.Structure):
+	_fields_ = [
+		('shmseg', ctypes.c_ulong),
+		('shmid', ctypes.c_int),
+		('shmaddr', ctypes.c_void_p),
+		('readOnly', ctypes.c_int),
+	]
+
+class XErrorEvent(ctypes.Structure):
+	_fields_ = [
+		('type', ctypes.c_int),
+		('display', ctypes.c_void_p),
+		('resourceid', ctypes.c_ulong),
+		('serial', ctypes.c_ulong),
+		('error_code', ctypes.c_ubyte),
+		('request_code', ctypes.c_ubyte),
+		('minor_code', ctypes.c_ubyte),
+	]
+
+class XRectangle(ctypes.Structure):
+	_fields_ = [
+		('x', ctypes.c_short),
+		('y', ctypes.c_short),
+		('width', ctypes.c_ushort),
+		('height', ctypes.c_ushort),
+	]
+
+class XDamageNotifyEvent(ctypes.Structure):
+	_fields_ = [
+		('type', ctypes.c_int),
+		('serial', ctypes.c_ulong),
+		('send_event', ctypes.c_int),
+		('display', ctypes.c_void_p),
+		('drawable', ctypes.c_ulong),
+		('damage', ctypes.c_ulong),
+		('level', ctypes.c_int),
+		('more', ctypes.c_int),
+		('timestamp', ctypes.c_ulong),
+		('area', XRectangle),
+		('geometry', XRectangle),
+	]
+
+class XEvent(ctypes.Union):
+	# Big enough for any event; cast to the actual event to read it.
+	_fields_ = [
+		('type', ctypes.c_int),
+		('pad', ctypes.c_long * 24),
+	]
+
+XErrorHandler = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(XErrorEvent))
+
+def load(name):
+	"""
+	Load one of the X libraries, raising XError if it isn't installed.
+	"""
+	path = ctypes.util.find_library(name)
+	if path is None:
+		raise XError("lib%s is not installed" % name)
+	return ctypes.CDLL(path)
+
+def declare(function, restype, *argtypes):
+	function.restype = restype
+	function.argtypes = list(argtypes)
+
+def xlib():
+	x11 = load('X11')
+	declare(x11.XOpenDisplay, ctypes.c_void_p, ctypes.c_char_p)
+	declare(x11.XCloseDisplay, ctypes.c_int, ctypes.c_void_p)
+	declare(x11.XDefaultScreen, ctypes.c_int, ctypes.c_void_p)
+	declare(x11.XRootWindow, ctypes.c_ulong, ctypes.c_void_p, ctypes.c_int)
+	declare(x11.XDisplayWidth, ctypes.c_int, ctypes.c_void_p, ctypes.c_int)
+	declare(x11.XDisplayHeight, ctypes.c_int, ctypes.c_void_p, ctypes.c_int)
+	declare(x11.XDefaultVisual, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int)
+	declare(x11.XDefaultDepth, ctypes.c_int, ctypes.c_void_p, ctypes.c_int)
+	declare(x11.XSync, ctypes.c_int, ctypes.c_void_p, ctypes.c_int)
+	declare(x11.XFree, ctypes.c_int, ctypes.c_void_p)
+	declare(x11.XFlush, ctypes.c_int, ctypes.c_void_p)
+	declare(x11.XPending, ctypes.c_int, ctypes.c_void_p)
+	declare(x11.XNextEvent, ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(XEvent))
+	declare(x11.XConnectionNumber, ctypes.c_int, ctypes.c_void_p)
+	# Takes and returns an XErrorHandler; left undeclared so that both the
+	# callbacks we make and the raw pointer it hands back can be passed in.
+	x11.XSetErrorHandler.restype = ctypes.c_void_p
+	return x11
+
+def xext():
+	ext = load('Xext')
+	declare(ext.XShmQueryExtension, ctypes.c_int, ctypes.c_void_p)
+	declare(ext.XShmCreateImage, ctypes.POINTER(XImage),
+		ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int,
+		ctypes.c_char_p, ctypes.POINTER(XShmSegmentInfo), ctypes.c_uint, ctypes.c_uint)
+	declare(ext.XShmAttach, ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(XShmSegmentInfo))
+	declare(ext.XShmDetach, ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(XShmSegmentInfo))
+	declare(ext.XShmGetImage, ctypes.c_int,
+		ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(XImage), ctypes.c_int, ctypes.c_int, ctypes.c_ulong)
+	return ext
+
+def xdamage():
+	damage = load('Xdamage')
+	declare(damage.XDamageQueryExtension, ctypes.c_int,
+		ctypes.c_void_p, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int))
+	declare(damage.XDamageQueryVersion, ctypes.c_int,
+		ctypes.c_void_p, ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int))
+	declare(damage.XDamageCreate, ctypes.c_ulong, ctypes.c_void_p, ctypes.c_ulong, ctypes.c_int)
+	declare(damage.XDamageDestroy, None, ctypes.c_void_p, ctypes.c_ulong)
+	return damage
+
+def libc():
+	c = ctypes.CDLL(ctypes.util.find_library('c'), use_errno = True)
+	declare(c.shmget, ctypes.c_int, ctypes.c_int, ctypes.c_size_t, ctypes.c_int)
+	declare(c.shmat, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_int)
+	declare(c.shmdt, ctypes.c_int, ctypes.c_void_p)
+	declare(c.shmctl, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_void_p)
+	return c
+
+class Display(object):
+	"""
+	An open X display, and its default screen and root window.
+	"""
+
+	def __init__(self, name = None):
+		self.x11 = xlib()
+		self.display = self.x11.XOpenDisplay(name)
+		if not self.display:
+			raise XError("unable to open the X display")
+
+		self.screen = self.x11.XDefaultScreen(self.display)
+		self.root = self.x11.XRootWindow(self.display, self.screen)
+		self.size = (
+			self.x11.XDisplayWidth(self.display, self.screen),
+			self.x11.XDisplayHeight(self.display, self.screen)
+		)
+
+	def trap_errors(self, function, *args):
+		"""
+		Call function and wait for the X server to process it, raising
+		XError if the server reported an error rather than letting Xlib's
+		default handler exit the process.
+		"""
+		errors = []
+
+		def handler(display, event):
+			errors.append(event.contents.error_code)
+			return 0
+
+		callback = XErrorHandler(handler)
+		previous = self.x11.XSetErrorHandler(callback)
+		try:
+			result = function(*args)
+			self.x11.XSync(self.display, 0)
+		finally:
+			self.x11.XSetErrorHandler(ctypes.c_void_p(previous))
+
+		if errors:
+			raise XError("X error %d" % errors[0])
+		return result
+
+	def close(self):
+		if self.display:
+			self.x11.XCloseDisplay(self.display)
+			self.display = None
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+# Script to benchmark the processing of the TV backlighting system
+# against made up screens, so that changes can be compared without
+# needing a real display.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import json
+import platform
+import socket
+import sys
+import timeit
+
+import numpy
+
+from backlight import synthetic
+from backlight.configuration import DEFAULTS
+from backlight.network import sender_for
+from backlight.processing import FrameProcessor
+from backlight.sampling import SampleGrid
+
+RESOLUTIONS = {
+	'1080p': (1920, 1080),
+	'4k': (3840, 2160),
+}
+
+# The stages, in the order they run.
+STAGES = ['scale', 'average', 'search', 'proc', 'send', 'total']
+
+# The settings that aren't being benchmarked, as the capture script has them.
+configuration = dict(DEFAULTS)
+configuration.update({
+	'host': '127.0.0.1',
+	'input': 1,
+})
+
+def parse_settings(value):
+	"""
+	Parse a list of size_x x size_y x average_frames, like 46x26x16,92x52x64.
+	"""
+	settings = []
+	for item in value.split(','):
+		size_x, size_y, average_frames = [int(part) for part in item.split('x')]
+		settings.append((size_x, size_y, average_frames))
+	return settings
+
+def summarise(times):
+	"""
+	Return the summary of a list of stage times, in seconds.
+	"""
+	times = numpy.array(times)
+	p50, p95, p99 = numpy.percentile(times, [50, 95, 99])
+	mean = times.mean()
+	return {
+		'mean': mean,
+		'p50': p50,
+		'p95': p95,
+		'p99': p99,
+		'fps': 1 / max(mean, 1e-9),
+	}
+
+def run_case(workload, resolution, size_x, size_y, average_frames, options, port):
+	"""
+	Push options.frames frames of the workload through the processing,
+	timing each stage, and return the result.
+	"""
+	width, height = RESOLUTIONS[resolution]
+
+	settings = dict(configuration)
+	settings.update({
+		'size_x': size_x,
+		'size_y': size_y,
+		'average_frames': average_frames,
+		'port': port,
+	})
+
+	grid = SampleGrid(width, height, size_x, size_y, options.zone_depth)
+	processor = FrameProcessor(settings)
+	sender = sender_for(settings, processor.pixel_count)
+
+	timer = timeit.default_timer
+	times = dict((stage, []) for stage in STAGES)
+	frames = synthetic.frames(workload, width, height)
+
+	for i in range(options.warmup + options.frames):
+		screen = next(frames)
+
+		start = timer()
+		scaled = grid.sample(screen)
+		scaletime = timer()
+		pixel_array = processor.average(scaled)
+		averagetime = timer()
+		black_top, black_bottom, black_left, black_right = processor.find_black_bars(pixel_array)
+		searchtime = timer()
+		edges = processor.extract(pixel_array, black_top, black_bottom, black_left, black_right)
+		proctime = timer()
+		sender.send(edges)
+		end = timer()
+
+		if i < options.warmup:
+			continue
+
+		times['scale'].append(scaletime - start)
+		times['average'].append(averagetime - scaletime)
+		times['search'].append(searchtime - averagetime)
+		times['proc'].append(proctime - searchtime)
+		times['send'].append(end - proctime)
+		times['total'].append(end - start)
+
+	sender.close()
+
+	return {
+		'workload': workload,
+		'resolution': resolution,
+		'size_x': size_x,
+		'size_y': size_y,
+		'average_frames': average_frames,
+		'zone_depth': options.zone_depth,
+		'frames': options.frames,
+		'stages': dict((stage, summarise(times[stage])) for stage in STAGES),
+	}
+
+def case_key(result):
+	return "%s %s %dx%dx%d depth %d" % (
+		result['workload'],
+		result['resolution'],
+		result['size_x'],
+		result['size_y'],
+		result['average_frames'],
+		result['zone_depth']
+	)
+
+def print_result(result):
+	print case_key(result)
+	for stage in STAGES:
+		summary = result['stages'][stage]
+		print "  %-8s %9.1f fps  p50 %8.3fms  p95 %8.3fms  p99 %8.3fms" % (
+			stage,
+			summary['fps'],
+			summary['p50'] * 1000,
+			summary['p95'] * 1000,
+			summary['p99'] * 1000
+		)
+
+def compare(results, baseline, threshold, min_difference):
+	"""
+	Return a list of descriptions of the stages whose median time has got
+	worse than the baseline by more than threshold (a fraction), ignoring
+	differences of less than min_difference seconds, which are just noise,
+	and a list of the cases that aren't in the baseline at all.
+	"""
+	previous = dict((case_key(result), result) for result in baseline['results'])
+
+	regressions = []
+	unmatched = []
+	for result in results:
+		key = case_key(result)
+		if key not in previous:
+			unmatched.append(key)
+			continue
+		for stage in STAGES:
+			before = previous[key]['stages'][stage]['p50']
+			after = result['stages'][stage]['p50']
+			if after - before > min_difference and after > before * (1 + threshold):
+				regressions.append("%s %s: %0.3fms -> %0.3fms" % (key, stage, before * 1000, after * 1000))
+	return regressions, unmatched
+
+def main():
+	parser = argparse.ArgumentParser(description = "Benchmark the processing against made up screens.")
+	parser.add_argument('--workloads', default = ','.join(synthetic.WORKLOADS),
+		help = "Comma separated workloads, from %s." % ', '.join(synthetic.WORKLOADS))
+	parser.add_argument('--resolutions', default = '1080p,4k',
+		help = "Comma separated screen resolutions, from %s." % ', '.join(sorted(RESOLUTIONS)))
+	parser.add_argument('--settings', default = '46x26x16,46x26x128,92x52x16', type = parse_settings,
+		help = "Comma separated size_x x size_y x average_frames to try.")
+	parser.add_argument('--zone-depth', default = 1, type = int)
+	parser.add_argument('--frames', default = 300, type = int, help = "Frames to time for each case.")
+	parser.add_argument('--warmup', default = 30, type = int, help = "Frames to run before timing.")
+	parser.add_argument('--output', help = "Save the results to this JSON file.")
+	parser.add_argument('--baseline', help = "Compare against the results saved in this JSON file.")
+	parser.add_argument('--threshold', default = 0.25, type = float,
+		help = "Fail if a stage is slower than the baseline by more than this fraction.")
+	parser.add_argument('--min-difference', default = 0.00005, type = float,
+		help = "Ignore slowdowns of less than this many seconds.")
+	options = parser.parse_args()
+
+	# Somewhere for the packets to go. Nothing reads them; once the socket
+	# buffer is full the kernel just drops them, which is fine.
+	sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	sink.bind(('127.0.0.1', 0))
+	port = sink.getsockname()[1]
+
+	results = []
+	for resolution in options.resolutions.split(','):
+		for workload in options.workloads.split(','):
+			for size_x, size_y, average_frames in options.settings:
+				result = run_case(workload, resolution, size_x, size_y, average_frames, options, port)
+				print_result(result)
+				results.append(result)
+
+	sink.close()
+
+	if options.output:
+		with open(options.output, 'w') as output:
+			json.dump({
+				'python': platform.python_version(),
+				'numpy': numpy.__version__,
+				'machine': platform.machine(),
+				'results': results,
+			}, output, indent = 1, sort_keys = True)
+		print "Saved the results to %s." % options.output
+
+	if options.baseline:
+		baseline = json.loads(open(options.baseline).read())
+		regressions, unmatched = compare(results, baseline, options.threshold, options.min_difference)
+		if unmatched:
+			print "%d cases aren't in the baseline, so weren't compared:" % len(unmatched)
+			for key in unmatched:
+				print "  " + key
+			if len(unmatched) == len(results):
+				print "Nothing was compared with the baseline."
+				sys.exit(1)
+		if regressions:
+			print "%d stages are slower than the baseline:" % len(regressions)
+			for regression in regressions:
+				print "  " + regression
+			sys.exit(1)
+		print "No stages are slower than the baseline."
+
+if __name__ == '__main__':
+	main()
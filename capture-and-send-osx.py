@@ -22,17 +22,27 @@
 # Thankyou for posting your questions and code; by sharing we all learn more!
 
 import time
-import struct
 import sys
-import socket
 import json
 import os
+import atexit
 
 import LaunchServices
 import Quartz.CoreGraphics as CG
 from Cocoa import NSURL
 import Quartz
 
+import numpy
+
+from backlight.averaging import FrameAverager
+from backlight.blackbars import BlackBarDetector, BlackBarTracker
+from backlight.colour import colour_corrector
+from backlight.edges import EdgeExtractor
+from backlight.metrics import Metrics, StatsServer
+from backlight.network import sender_for
+from backlight.recording import packet_recorder
+from backlight.sampling import zone_average
+
 # Configuration defaults.
 configuration = {
     # Target host and port number.
@@ -44,10 +54,20 @@ configuration = {
     'size_y': 26,
 
     # The number of frames to average together (to stop flashing/flickering)
+    # This costs the same whatever it is set to, so it can be raised to 64 or
+    # 128 for smoother output, at the cost of slower response.
     'average_frames': 32,
 
-    # How many pixels to probe looking for black bars.
+    # How many rows in from the top and the bottom, and columns in from the
+    # left and the right, to look for black bars. Movies are often letterboxed
+    # (bars at the top and bottom), and older shows pillarboxed (at the sides).
     'black_bar_search_height': 8,
+    'black_bar_search_width': 8,
+
+    # A row or column counts as part of a black bar if nothing in it is
+    # brighter than this (out of 255). The bars in compressed video are rarely
+    # quite black.
+    'black_bar_threshold': 10,
 
     # The number of frames to consider the black bar height for.
     # The minimum detected bottom from this length is used.
@@ -57,9 +77,78 @@ configuration = {
     # the movie better, and also deal with non-black-bar videos as well.
     'black_bar_candidate_length': 1024,
 
+    # Alternatively, the number of seconds to consider the black bar height for.
+    # If set, this is used instead of black_bar_candidate_length, so that the
+    # detection doesn't depend on how fast we can capture.
+    'black_bar_candidate_seconds': None,
+
+    # How the LED strip runs around the TV. For example,
+    # {"start": "bottom", "position": 0.5, "direction": "clockwise",
+    #  "edges": ["left", "top", "right"]} starts in the middle of the bottom and
+    # goes clockwise around the other three edges. The default (None) starts at
+    # the bottom left corner and goes anticlockwise around all four.
+    'layout': None,
+
     # Divide the colours by this number. This is because the LED
     # strip tends to be super bright, so this crudely dims it down somewhat.
-    'colour_divisor': 2
+    'colour_divisor': 2,
+
+    # Colour correction for the LEDs, which is worked out once into a table of
+    # what to send for each level of each colour. The levels are gamma corrected
+    # (WS2812s look washed out without; try 2.2), scaled by brightness (0 to 1)
+    # and by the white point, the red, green and blue levels that make the
+    # strip look white. Levels below colour_minimum end up off, rather than
+    # flickering. colour_divisor above is applied as well.
+    'brightness': 1.0,
+    'gamma': 1.0,
+    'white_point': [255, 255, 255],
+    'colour_minimum': 0,
+
+    # If set, only send the pixels that have changed by more than this much
+    # since they were last sent, which saves a lot of traffic for most pictures.
+    # A full frame is still sent every delta_keyframe_interval frames, in case
+    # any packets went missing.
+    'delta_threshold': None,
+    'delta_keyframe_interval': 30,
+
+    # Send three bytes per pixel instead of four. This needs the updated sketch,
+    # and fits 198 pixels in a packet instead of 150.
+    'packed_pixels': False,
+
+    # The largest packet the sketch can take (PACKET_MAX_SIZE in the sketch).
+    # Frames bigger than this are split over several packets.
+    'packet_max_size': 600,
+
+    # To send parts of the edge to different controllers, list them here, like:
+    # [{"first": 0, "count": 45, "host": "10.0.14.201"}, {"first": 45, "count": 92}]
+    # Each segment can also override port, input and the options above.
+    'segments': [],
+
+    # Add the time each packet was sent to the end of it, so emulate-sketch.py
+    # can measure the latency. The sketch ignores it.
+    'send_timestamps': False,
+
+    # Each pixel is the average of a zone_depth x zone_depth grid of samples
+    # from its part of the screen, rather than a single screen pixel. This
+    # gives steadier colours, so fewer frames need averaging.
+    'zone_depth': 1,
+
+    # Print a summary of how long each step is taking every this many seconds.
+    # Set to 0 to print the times of every frame instead, which slows things
+    # down a little.
+    'summary_seconds': 10,
+
+    # Serve the timings and counts on this local address, either "host:port"
+    # or the path of a Unix socket, for example "127.0.0.1:8890". Connect to
+    # get JSON, or fetch /metrics over HTTP for Prometheus.
+    'stats_address': None,
+
+    # Record every packet sent, with its timing, to this file, to replay later
+    # with replay-recording.py. The file is set up at record_megabytes to start
+    # with (and cut down to what was used when the script stops), and recording
+    # stops once it's full. A gigabyte is over an hour at 60 frames a second.
+    'record_file': None,
+    'record_megabytes': 1024
 }
 
 # Load the configuration.
@@ -78,10 +167,15 @@ class ScreenPixel(object):
     def __init__(self, config):
         self.target_width = config['size_x']
         self.target_height = config['size_y']
-        self.colour_scale = config['colour_divisor']
-        self.average_frames = config['average_frames']
 
-        self.last_values = {}
+        # CoreGraphics samples this many times bigger than the target, and
+        # we average each block of samples down to one pixel.
+        self.zone_depth = config['zone_depth']
+        self.sample_width = self.target_width * self.zone_depth
+        self.sample_height = self.target_height * self.zone_depth
+
+        self.averager = FrameAverager(self.target_width, self.target_height, config['average_frames'])
+        self.pixels = self.averager.average
 
     def capture(self, region = None):
         """region should be a CGRect, something like:
@@ -122,17 +216,17 @@ class ScreenPixel(object):
         colourspace = CG.CGImageGetColorSpace(image)
         context = CG.CGBitmapContextCreate(
             None,
-            self.target_width,
-            self.target_height,
+            self.sample_width,
+            self.sample_height,
             8, # CG.CGImageGetBitsPerComponent(image),
-            self.target_width * 4, # CG.CGImageGetBytesPerRow(image),
+            self.sample_width * 4, # CG.CGImageGetBytesPerRow(image),
             colourspace,
             CG.CGImageGetAlphaInfo(image)
         )
 
         CG.CGContextSetInterpolationQuality(context, CG.kCGInterpolationNone)
 
-        CG.CGContextDrawImage(context, CG.CGRectMake(0, 0, self.target_width, self.target_height), image)
+        CG.CGContextDrawImage(context, CG.CGRectMake(0, 0, self.sample_width, self.sample_height), image)
 
         result = CG.CGBitmapContextCreateImage(context)
 
@@ -157,65 +251,19 @@ class ScreenPixel(object):
         # Copy data out of CGDataProvider, becomes string of bytes
         self._data = CG.CGDataProviderCopyData(prov)
 
+        # The pixel data is (alpha, red, green, blue) bytes; view the
+        # colour part of it as an array, average the zones down to one pixel
+        # each, and average it with the last frames.
+        frame = numpy.frombuffer(self._data, dtype = numpy.uint8)
+        frame = frame.reshape(self.sample_height, self.sample_width, 4)
+        self.pixels = self.averager.push(zone_average(frame[:, :, 1:], self.zone_depth))
+
         del prov
         del result
         del image
         del context
         del colourspace
 
-    def pixel(self, x, y):
-        """Get pixel value at given (x,y) screen coordinates
-
-        Must call capture first.
-        """
-
-        # Pixel data is unsigned char (8bit unsigned integer),
-        # and there are for (blue,green,red,alpha)
-        data_format = "BBBB"
-
-        # Calculate offset, based on
-        # http://www.markj.net/iphone-uiimage-pixel-color/
-        offset = 4 * ((self.target_width*int(round(y))) + int(round(x)))
-
-        # Unpack data from string into Python'y integers
-        # Original internet code had this:
-        # b, g, r, a = struct.unpack_from(data_format, self._data, offset=offset)
-        # But it turns out this is the correct order:
-        a, r, g, b = struct.unpack_from(data_format, self._data, offset=offset)
-
-        r = r / self.colour_scale
-        g = g / self.colour_scale
-        b = b / self.colour_scale
-
-        result_key_r = "%d_%d_r" % (x, y)
-        result_key_g = "%d_%d_g" % (x, y)
-        result_key_b = "%d_%d_b" % (x, y)
-
-        if result_key_r not in self.last_values:
-            self.last_values[result_key_r] = []
-        if result_key_g not in self.last_values:
-            self.last_values[result_key_g] = []
-        if result_key_b not in self.last_values:
-            self.last_values[result_key_b] = []
-
-        if len(self.last_values[result_key_r]) >= self.average_frames:
-            self.last_values[result_key_r] = self.last_values[result_key_r][1:]
-        if len(self.last_values[result_key_g]) >= self.average_frames:
-            self.last_values[result_key_g] = self.last_values[result_key_g][1:]
-        if len(self.last_values[result_key_b]) >= self.average_frames:
-            self.last_values[result_key_b] = self.last_values[result_key_b][1:]
-
-        self.last_values[result_key_r].append(r)
-        self.last_values[result_key_g].append(g)
-        self.last_values[result_key_b].append(b)
-
-        r = sum(self.last_values[result_key_r]) / len(self.last_values[result_key_r])
-        g = sum(self.last_values[result_key_g]) / len(self.last_values[result_key_g])
-        b = sum(self.last_values[result_key_b]) / len(self.last_values[result_key_b])
-
-        colour = (r * 256 * 256) + (g * 256) + b
-        return colour
-
 # Cap the first time to get the window size.
 capture = ScreenPixel(configuration)
 capture.capture()
@@ -224,15 +272,38 @@ height = capture.screen_height
 print "The size of the window is %d x %d" % (width, height)
 
 # Calculations for later on.
-arduino_pixels = ((configuration['size_x'] * 2) + (configuration['size_y'] * 2)) - 4
-black_bar_probe_points = [0, configuration['size_x'] / 4, configuration['size_x'] / 2, int(configuration['size_x'] * 0.75), configuration['size_x'] - 1]
-black_bar_top_candidates = [0] * configuration['black_bar_candidate_length']
-black_bar_bottom_candidates = [0] * configuration['black_bar_candidate_length']
-black_bar_top_candidate_index = 0
-black_bar_bottom_candidate_index = 0
+edge_extractor = EdgeExtractor(configuration['size_x'], configuration['size_y'], configuration['layout'])
+arduino_pixels = edge_extractor.pixel_count
+corrector = colour_corrector(configuration, arduino_pixels)
+black_bar_detector = BlackBarDetector(
+    configuration['size_x'],
+    configuration['size_y'],
+    configuration['black_bar_search_height'],
+    configuration['black_bar_search_width'],
+    configuration['black_bar_threshold']
+)
+black_bar_tracker = BlackBarTracker(configuration['black_bar_candidate_length'], configuration['black_bar_candidate_seconds'])
 
 print "Sending %d pixels each screen." % arduino_pixels
 
+# Finished off when we exit, however that happens.
+recorder = packet_recorder(configuration)
+if recorder:
+    atexit.register(recorder.close)
+
+# Open the sockets once, and reuse them for every frame.
+sender = sender_for(configuration, arduino_pixels, recorder)
+
+metrics = Metrics(['cap', 'scale', 'search', 'proc', 'send', 'total'])
+metrics.add_source('send_errors', lambda: sender.errors)
+metrics.add_source('network_outages', lambda: sender.outages)
+
+if configuration['stats_address']:
+    stats_server = StatsServer(metrics, configuration['stats_address'])
+    print "Serving stats on %s." % configuration['stats_address']
+
+last_summary = time.time()
+
 while True:
     start = time.time()
 
@@ -243,102 +314,42 @@ while True:
 
     scaletime = time.time()
 
-    real_height = capture.target_height - 1
-    real_width = capture.target_width - 1
-
     # Search for the black bars.
-    black_top = 0
-    black_bottom = real_height
-
-    top_candidates = []
-    bottom_candidates = []
-
-    for x in black_bar_probe_points:
-        this_top = 0
-        this_bottom = real_height
-        for y in range(configuration['black_bar_search_height']):
-            colour = capture.pixel(x, y)
-            if colour == 0x0:
-                this_top = y + 1
-            colour = capture.pixel(x, real_height - y)
-            if colour == 0x0:
-                this_bottom = (real_height - y) - 1
-
-        top_candidates.append(this_top)
-        bottom_candidates.append(this_bottom)
-
-    black_top = min(*top_candidates)
-    black_bottom = max(*bottom_candidates)
+    black_top, black_bottom, black_left, black_right = black_bar_detector.detect(capture.pixels)
+    black_top, black_bottom, black_left, black_right = black_bar_tracker.update(black_top, black_bottom, black_left, black_right, start)
 
-    black_bar_top_candidates[black_bar_top_candidate_index] = black_top
-    black_bar_bottom_candidates[black_bar_bottom_candidate_index] = black_bottom
-
-    black_bar_top_candidate_index += 1
-    if black_bar_top_candidate_index == configuration['black_bar_candidate_length']:
-        black_bar_top_candidate_index = 0
-
-    black_bar_bottom_candidate_index += 1
-    if black_bar_bottom_candidate_index == configuration['black_bar_candidate_length']:
-        black_bar_bottom_candidate_index = 0
-
-    black_top = min(*black_bar_top_candidates)
-    black_bottom = max(*black_bar_bottom_candidates)
-
-    # print "Black bars: %d -> %d" % (black_top, black_bottom)
+    # print "Black bars: %d -> %d, %d -> %d" % (black_top, black_bottom, black_left, black_right)
 
     searchtime = time.time()
 
-    network_message = 'P'
-    network_message += struct.pack('<B', configuration['input'])
-    network_message += struct.pack('<H', arduino_pixels)
-
-    # Bottom of image first, left to right.
-    y = black_bottom
-    for x in range(real_width):
-        colour = capture.pixel(x, y)
-        # print "%d, %d: %X" % (x, y, colour)
-        network_message += struct.pack('<I', colour)
-
-    # Right side, bottom to top.
-    x = real_width
-    for y in range(real_height, 0, -1):
-        colour = capture.pixel(x, y)
-        # print "%d, %d: %X" % (x, y, colour)
-        network_message += struct.pack('<I', colour)
-
-    # Top side, right to left.
-    y = black_top
-    for x in range(real_width, 0, -1):
-        colour = capture.pixel(x, y)
-        # print "%d, %d: %X" % (x, y, colour)
-        network_message += struct.pack('<I', colour)
-
-    # Left side, top to bottom.
-    x = 0
-    for y in range(real_height):
-        colour = capture.pixel(x, y)
-        # print "%d, %d: %X" % (x, y, colour)
-        network_message += struct.pack('<I', colour)
-
-    try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.sendto(network_message, (configuration['host'], configuration['port']))
-    except socket.error, ex:
-        # Unable to send. On OSX, this happens as it resumes from
-        # sleep whilst the network comes back.
-        # Wait for a bit and then try again.
-        print str(ex)
-        print "Retrying shortly."
-        time.sleep(2)
-
-    # print "Sent %d bytes." % len(network_message)
+    # Pull out all the edge pixels in one go, colour correct them, and send them.
+    edges = corrector.correct(edge_extractor.extract(capture.pixels, black_top, black_bottom, black_left, black_right))
+    proctime = time.time()
+    # If the network is gone, as it is for a bit as OSX resumes from
+    # sleep, this carries on regardless, and the LEDs catch up with the
+    # first frame that gets through.
+    sender.send(edges)
 
     end = time.time()
-    # print "Total time %0.4fs. Cap %0.4fs, Scale %0.4fs, Search %0.4fs, Proc %0.4fs, FPS %0.2f" % (
-    #     end - start,
-    #     captime - start,
-    #     scaletime - captime,
-    #     searchtime - scaletime,
-    #     end - searchtime,
-    #     1 / (end - start)
-    # )
+
+    metrics.record('cap', captime - start)
+    metrics.record('scale', scaletime - captime)
+    metrics.record('search', searchtime - scaletime)
+    metrics.record('proc', proctime - searchtime)
+    metrics.record('send', end - proctime)
+    metrics.record('total', end - start)
+    metrics.increment('frames')
+
+    if not configuration['summary_seconds']:
+        print "Total time %0.4fs. Cap %0.4fs, Scale %0.4fs, Search %0.4fs, Proc %0.4fs, Send %0.4fs, FPS %0.2f" % (
+            end - start,
+            captime - start,
+            scaletime - captime,
+            searchtime - scaletime,
+            proctime - searchtime,
+            end - proctime,
+            1 / max(end - start, 0.0001)
+        )
+    elif end - last_summary >= configuration['summary_seconds']:
+        print metrics.summary()
+        last_summary = end
@@ -18,203 +18,384 @@
 # limitations under the License.
 
 import time
-import gtk.gdk
-import struct
 import sys
-import socket
 import json
 import os
-
-# Configuration defaults.
-configuration = {
-	# Target host and port number.
-	'host': "10.0.14.200",
-	'port': 8888,
-
-	# The number of pixels actually attached to the TV.
-	'size_x': 46,
-	'size_y': 26,
-
-	# The number of frames to average together (to stop flashing/flickering)
-	'average_frames': 16,
-
-	# How many pixels to probe looking for black bars.
-	'black_bar_search_height': 8,
-
-	# The number of frames to consider the black bar height for.
-	# The minimum detected bottom from this length is used.
-	# For example, with this at 1024, if we capture at 50fps, then the black bar mininum
-	# for the last 20 seconds is used. This makes it a little slow
-	# to detect the start of movies, but should allow the detection to work through
-	# the movie better, and also deal with non-black-bar videos as well.
-	'black_bar_candidate_length': 1024,
-
-	# Divide the colours by this number. This is because the LED
-	# strip tends to be super bright, so this crudely dims it down somewhat.
-	'colour_divisor': 2,
-}
+import threading
+import atexit
+
+import numpy
+
+from backlight.capture import capture_backend, CaptureFinished
+from backlight.configuration import DEFAULTS
+from backlight.control import ControlServer, ControlError, parse_colour, parse_input
+from backlight.damage import damage_watcher
+from backlight.metrics import Metrics, StatsServer
+from backlight.network import sender_for
+from backlight.pacing import FramePacer, ChangeDetector
+from backlight.pipeline import Pipeline
+from backlight.processing import FrameProcessor
+from backlight.recording import packet_recorder
+from backlight.sources import run_sources
 
 # Load the configuration.
 if not os.path.exists('config.json'):
 	print "No config.json found - please create and try again."
 	sys.exit()
 
+defaults = DEFAULTS
+configuration = dict(defaults)
 configuration.update(json.loads(open('config.json').read()))
 
-# Get the window size.
-window = gtk.gdk.get_default_root_window()
-size = window.get_size()
-print "The size of the window is %d x %d" % size
-
-# Calculations for later on.
-scale_x = float(configuration['size_x']) / float(size[0])
-scale_y = float(configuration['size_y']) / float(size[1])
-current_buffer = 0
-composite_alpha = (255 / configuration['average_frames'])
-arduino_pixels = ((configuration['size_x'] * 2) + (configuration['size_y'] * 2)) - 4
-black_bar_probe_points = [0, configuration['size_x'] / 4, configuration['size_x'] / 2, int(configuration['size_x'] * 0.75), configuration['size_x'] - 1]
-black_bar_top_candidates = [0] * configuration['black_bar_candidate_length']
-black_bar_bottom_candidates = [0] * configuration['black_bar_candidate_length']
-black_bar_top_candidate_index = 0
-black_bar_bottom_candidate_index = 0
-
-print "Sending %d pixels each screen." % arduino_pixels
-
-# Set up the buffers - only once, and we'll reuse them.
-screen_contents = gtk.gdk.Pixbuf(gtk.gdk.COLORSPACE_RGB, False, 8, size[0], size[1])
-screen_buffers = []
-for i in range(configuration['average_frames']):
-	screen_buffers.append(gtk.gdk.Pixbuf(gtk.gdk.COLORSPACE_RGB, False, 8, configuration['size_x'], configuration['size_y']))
-scaled_contents = gtk.gdk.Pixbuf(gtk.gdk.COLORSPACE_RGB, False, 8, configuration['size_x'], configuration['size_y'])
-
-def colourfor(pa, x, y, scale = 1):
-	"""
-	Helper function to get a pixel from a Numpy pixel array and
-	reassemble it.
-	"""
-	raw_pixel = pa[y][x]
-	red = raw_pixel[0] / scale
-	green = raw_pixel[1] / scale
-	blue = raw_pixel[2] / scale
-	colour = (red * 256 * 256) + (green * 256) + blue
-	return colour
-
-while True:
-	start = time.time()
-
-	# Fetch, scale down.
-	screen_contents = screen_contents.get_from_drawable(window, window.get_colormap(), 0, 0, 0, 0, size[0], size[1])
-	captime = time.time()
-
-	# Scale into the current buffer.
-	screen_contents.scale(screen_buffers[current_buffer], 0, 0, configuration['size_x'], configuration['size_y'], 0, 0, scale_x, scale_y, gtk.gdk.INTERP_NEAREST)
+# These only work with a single source, so say so rather than quietly doing
+# without them.
+if configuration['sources']:
+	for option in ['pipeline', 'stats_address', 'control_socket']:
+		if configuration[option]:
+			print "Ignoring %s, which only works without sources." % option
+			configuration[option] = defaults[option]
 
-	# Wrap the buffer number around, if needed.
-	current_buffer += 1
-	if current_buffer >= configuration['average_frames']:
-		current_buffer = 0
-
-	# Clear the scaled contents, then composite the last frames on top of it.
-	scaled_contents.fill(0x00000000)
-
-	for i in range(configuration['average_frames']):
-		screen_buffers[i].composite(scaled_contents, 0, 0, configuration['size_x'], configuration['size_y'], 0, 0, 1.0, 1.0, gtk.gdk.INTERP_NEAREST, composite_alpha)
+class Runtime(object):
+	"""
+	Everything that is set up from the configuration. When the
+	configuration is reloaded, a new one is set up and swapped in between
+	frames, so each frame carries the Runtime it was captured with.
 
-	scaletime = time.time()
+	With several sources, each worker process has a Runtime without a
+	sender, and label says which source it is.
+	"""
 
-	# Debugging code to save the frame that we're just composited.
-	#screen_contents.scale(scaled_contents, 0, 0, minisize_x, minisize_y, 0, 0, scale_x, scale_y, gtk.gdk.INTERP_NEAREST)
-	#scaled_contents.save("screenshot%d.png" % time.time(), "png")
+	def __init__(self, configuration, sending = True, label = ''):
+		self.configuration = configuration
+
+		# Set up the capture, and get the window size.
+		self.capture = capture_backend(configuration)
+		print "%sCapturing with %s." % (label, self.capture.name)
+		print "%sThe size of the window is %d x %d" % ((label,) + self.capture.size)
+
+		try:
+			# Calculations for later on.
+			self.processor = FrameProcessor(configuration)
+			self.pixel_count = self.processor.pixel_count
+
+			# Open the sockets once, and reuse them for every frame.
+			if sending:
+				print "Sending %d pixels each screen." % self.pixel_count
+				self.sender = sender_for(configuration, self.pixel_count, recorder)
+			else:
+				self.sender = None
+		except:
+			self.capture.close()
+			raise
+
+		self.pacer = FramePacer(configuration['target_fps'], configuration['max_fps'])
+
+		# Once this many identical frames have been seen, the average has caught up,
+		# so nothing more would change until the screen does.
+		if configuration['skip_unchanged']:
+			self.change_detector = ChangeDetector(configuration['average_frames'], configuration['keepalive_ms'] / 1000.0)
+		else:
+			self.change_detector = None
+
+		if configuration['capture_on_damage']:
+			self.damage = damage_watcher(configuration, self.capture.size, self.capture.origin)
+		else:
+			self.damage = None
+
+		# What the Runtimes before a reload counted, so the totals carry on
+		# from there rather than going back to 0.
+		self.carried = {'send_errors': 0, 'network_outages': 0, 'skipped_frames': 0}
+
+	def counts(self):
+		"""
+		Return the sender's and change detector's counts, including those
+		from before any reloads.
+		"""
+		return {
+			'send_errors': self.carried['send_errors'] + self.sender.errors,
+			'network_outages': self.carried['network_outages'] + self.sender.outages,
+			'skipped_frames': self.carried['skipped_frames'] + (self.change_detector.skipped if self.change_detector else 0),
+		}
+
+	def close(self):
+		self.capture.close()
+		if self.sender:
+			self.sender.close()
+		if self.damage:
+			self.damage.close()
+
+# Finished off when we exit, however that happens.
+recorder = packet_recorder(configuration)
+if recorder:
+	atexit.register(recorder.close)
+
+# With several sources, each worker process sets up its own.
+if configuration['sources']:
+	runtime = None
+else:
+	runtime = Runtime(configuration)
+
+# Set by the control socket. The capture stage swaps in a reloaded Runtime,
+# and waits while we're paused. Sending and the commands take the lock, so
+# that no frame goes out after a command has changed what's on the strip.
+reloaded = None
+running = threading.Event()
+running.set()
+control_lock = threading.Lock()
+
+# The input switched to over the control socket, which outlasts a reload.
+switched_input = None
+
+# The Pipeline, once it's running, if pipeline is set.
+pipeline = None
+
+metrics = Metrics(['cap', 'scale', 'search', 'proc', 'send', 'total'])
+metrics.add_source('send_errors', lambda: runtime.counts()['send_errors'])
+metrics.add_source('network_outages', lambda: runtime.counts()['network_outages'])
+metrics.add_source('dropped_frames', lambda: pipeline.dropped if pipeline else 0)
+metrics.add_source('skipped_frames', lambda: runtime.counts()['skipped_frames'])
+
+if configuration['stats_address']:
+	stats_server = StatsServer(metrics, configuration['stats_address'])
+	print "Serving stats on %s." % configuration['stats_address']
+
+# When the last frame was sent, to work out the frame rate, and when the
+# last summary was printed.
+last_sent = time.time()
+last_summary = last_sent
+
+def capture_frame():
+	"""
+	Capture the screen and scale it down. The frame is a dict of the
+	data and stage timings, which is passed along to the later stages.
+	Returns None if the frame is the same as the last ones, and so
+	doesn't need processing.
+	"""
+	global runtime, reloaded
+
+	# Wait with a timeout, so that Ctrl-C still works.
+	while not running.wait(0.5):
+		pass
+
+	if reloaded:
+		with control_lock:
+			old = runtime
+			reloaded.carried = old.counts()
+			runtime = reloaded
+			reloaded = None
+		old.close()
+
+	current = runtime
+	keepalive = False
+	if current.damage:
+		keepalive = current.damage.wait()
+
+	start = current.pacer.wait()
+	current.capture.capture()
+	captime = time.time()
 
-	real_height = scaled_contents.get_height() - 1
-	real_width = scaled_contents.get_width() - 1
-	pixel_array = scaled_contents.pixel_array
+	# Copy out of the capture's buffer, which the next capture reuses.
+	scaled = current.capture.scale().copy()
 
-	# Search for the black bars.
-	black_top = 0
-	black_bottom = real_height
+	if current.change_detector and not current.change_detector.changed(scaled, start, keepalive):
+		return None
 
-	top_candidates = []
-	bottom_candidates = []
+	return {
+		'runtime': current,
+		'start': start,
+		'scaled': scaled,
+		'cap': captime - start,
+		'scale': time.time() - captime,
+	}
 
-	for x in black_bar_probe_points:
-		this_top = 0
-		this_bottom = real_height
-		for y in range(configuration['black_bar_search_height']):
-			colour = colourfor(pixel_array, x, y)
-			if colour == 0x0:
-				this_top = y + 1
-			colour = colourfor(pixel_array, x, real_height - y)
-			if colour == 0x0:
-				this_bottom = (real_height - y) - 1
+def process_frame(frame):
+	"""
+	Average the frame with the last ones, find the black bars, and pull
+	out the edge pixels.
+	"""
+	processor = frame['runtime'].processor
+	start = time.time()
 
-		top_candidates.append(this_top)
-		bottom_candidates.append(this_bottom)
+	# Average with the last frames.
+	pixel_array = processor.average(frame['scaled'])
 
-	black_top = min(*top_candidates)
-	black_bottom = max(*bottom_candidates)
+	scaletime = time.time()
 
-	black_bar_top_candidates[black_bar_top_candidate_index] = black_top
-	black_bar_bottom_candidates[black_bar_bottom_candidate_index] = black_bottom
+	black_top, black_bottom, black_left, black_right = processor.find_black_bars(pixel_array, frame['start'])
 
-	black_bar_top_candidate_index += 1
-	if black_bar_top_candidate_index == configuration['black_bar_candidate_length']:
-		black_bar_top_candidate_index = 0
+	# print "Black bars: %d -> %d, %d -> %d" % (black_top, black_bottom, black_left, black_right)
 
-	black_bar_bottom_candidate_index += 1
-	if black_bar_bottom_candidate_index == configuration['black_bar_candidate_length']:
-		black_bar_bottom_candidate_index = 0
+	searchtime = time.time()
 
-	black_top = min(*black_bar_top_candidates)
-	black_bottom = max(*black_bar_bottom_candidates)
+	# Pull out all the edge pixels in one go. Copy them, as the sending
+	# might happen while the next frame is being processed.
+	frame['edges'] = processor.extract(pixel_array, black_top, black_bottom, black_left, black_right).copy()
 
-	# print "Black bars: %d -> %d" % (black_top, black_bottom)
+	frame['scale'] += scaletime - start
+	frame['search'] = searchtime - scaletime
+	frame['proc'] = time.time() - searchtime
+	return frame
 
-	searchtime = time.time()
+def send_frame(frame):
+	"""
+	Send the edge pixels, and record how long it all took.
+	"""
+	global last_sent, last_summary
 
-	network_message = 'P'
-	network_message += struct.pack('<B', configuration['input'])
-	network_message += struct.pack('<H', arduino_pixels)
-
-	# Bottom of image first, left to right.
-	y = black_bottom
-	for x in range(real_width):
-		colour = colourfor(pixel_array, x, y, configuration['colour_divisor'])
-		# print "%d, %d: %X" % (x, y, colour)
-		network_message += struct.pack('<I', colour)
-
-	# Right side, bottom to top.
-	x = real_width
-	for y in range(real_height, 0, -1):
-		colour = colourfor(pixel_array, x, y, configuration['colour_divisor'])
-		# print "%d, %d: %X" % (x, y, colour)
-		network_message += struct.pack('<I', colour)
-
-	# Top side, right to left.
-	y = black_top
-	for x in range(real_width, 0, -1):
-		colour = colourfor(pixel_array, x, y, configuration['colour_divisor'])
-		# print "%d, %d: %X" % (x, y, colour)
-		network_message += struct.pack('<I', colour)
-
-	# Left side, top to bottom.
-	x = 0
-	for y in range(real_height):
-		colour = colourfor(pixel_array, x, y, configuration['colour_divisor'])
-		# print "%d, %d: %X" % (x, y, colour)
-		network_message += struct.pack('<I', colour)
-
-	sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-	sock.sendto(network_message, (configuration['host'], configuration['port']))
-
-	# print "Sent %d bytes." % len(network_message)
+	start = time.time()
+	with control_lock:
+		# Frames from before a pause or a reload are dropped.
+		if not running.is_set() or frame['runtime'] is not runtime:
+			return
+		runtime.sender.send(frame['edges'])
 
 	end = time.time()
-	print "Total time %0.4fs. Cap %0.4fs, Scale %0.4fs, Search %0.4fs, Proc %0.4fs, FPS %0.2f" % (
-		end - start,
-		captime - start,
-		scaletime - captime,
-		searchtime - scaletime,
-		end - searchtime,
-		1 / (end - start)
-	)
\ No newline at end of file
+	frame['send'] = end - start
+	frame['total'] = end - frame['start']
+
+	for stage in metrics.stages:
+		metrics.record(stage, frame[stage])
+	metrics.increment('frames')
+
+	if not runtime.configuration['summary_seconds']:
+		# With the pipeline, frames overlap, so the frame rate comes from how
+		# often they're sent rather than how long each one took.
+		print "Total time %0.4fs. Cap %0.4fs, Scale %0.4fs, Search %0.4fs, Proc %0.4fs, Send %0.4fs, FPS %0.2f, Dropped %d, Skipped %d" % (
+			frame['total'],
+			frame['cap'],
+			frame['scale'],
+			frame['search'],
+			frame['proc'],
+			frame['send'],
+			1 / max(end - last_sent, 0.0001),
+			pipeline.dropped if pipeline else 0,
+			runtime.counts()['skipped_frames']
+		)
+	elif end - last_summary >= runtime.configuration['summary_seconds']:
+		print metrics.summary()
+		last_summary = end
+	last_sent = end
+
+def command_input(request):
+	"""
+	Switch input, filling the strip with the given colour until the
+	pixels for that input arrive.
+	"""
+	global switched_input
+	inp = parse_input(request['input'])
+	colour = parse_colour(request.get('colour', 0))
+	with control_lock:
+		runtime.sender.send_input(inp, colour)
+		switched_input = inp
+
+def command_colour(request):
+	"""
+	Pause, and fill the strip with a colour.
+	"""
+	colour = parse_colour(request['colour'])
+	with control_lock:
+		inp = switched_input if switched_input is not None else runtime.configuration['input']
+		runtime.sender.send_input(inp, colour)
+		running.clear()
+
+def command_pixels(request):
+	"""
+	Pause, and send a frame of the given colours, repeated along the strip.
+	"""
+	colours = [parse_colour(colour) for colour in request['colours']]
+	if not colours:
+		raise ControlError("No colours given.")
+	with control_lock:
+		words = numpy.resize(numpy.array(colours, dtype = numpy.uint32), runtime.pixel_count)
+		rgb = numpy.zeros((runtime.pixel_count, 3), dtype = numpy.uint8)
+		rgb[:, 0] = words >> 16
+		rgb[:, 1] = words >> 8
+		rgb[:, 2] = words
+		runtime.sender.send(rgb)
+		running.clear()
+
+def command_pause(request):
+	with control_lock:
+		running.clear()
+
+def command_resume(request):
+	running.set()
+
+def command_reload(request):
+	"""
+	Reload config.json, and swap everything over to it before the next
+	frame. Anything wrong with it is reported, and the old one kept.
+	"""
+	global reloaded
+	try:
+		updated = dict(defaults)
+		updated.update(json.loads(open('config.json').read()))
+	except (IOError, ValueError, TypeError), ex:
+		raise ControlError("Unable to read config.json: %s" % ex)
+
+	new = None
+	try:
+		new = Runtime(updated)
+		if switched_input is not None:
+			new.sender.set_input(switched_input)
+	except Exception, ex:
+		if new:
+			new.close()
+		raise ControlError("Unable to reload: %s" % ex)
+	with control_lock:
+		if reloaded:
+			reloaded.close()
+		reloaded = new
+	return {'pixels': new.pixel_count}
+
+def command_stats(request):
+	reply = metrics.snapshot()
+	reply['paused'] = not running.is_set()
+	reply['pixels'] = runtime.pixel_count
+	reply['input'] = switched_input if switched_input is not None else runtime.configuration['input']
+	return reply
+
+if configuration['control_socket']:
+	control_server = ControlServer(configuration['control_socket'], {
+		'input': command_input,
+		'colour': command_colour,
+		'pixels': command_pixels,
+		'pause': command_pause,
+		'resume': command_resume,
+		'reload': command_reload,
+		'stats': command_stats,
+	})
+	print "Listening for commands on %s." % configuration['control_socket']
+
+def run_source(number, settings, publish):
+	"""
+	Capture and process one of the sources, in the worker process that
+	run_sources() has started for it, just as for a single source. The
+	frames are handed to publish() to be sent by the main process.
+	"""
+	global runtime
+	runtime = Runtime(settings, False, "Source %d: " % number)
+	try:
+		while True:
+			frame = capture_frame()
+			if frame:
+				frame = process_frame(frame)
+				frame['skipped'] = runtime.change_detector.skipped if runtime.change_detector else 0
+				publish(frame)
+	finally:
+		runtime.close()
+
+try:
+	if configuration['sources']:
+		run_sources(configuration, run_source, recorder)
+	elif configuration['pipeline']:
+		pipeline = Pipeline(capture_frame, process_frame, send_frame)
+		pipeline.run()
+	else:
+		while True:
+			frame = capture_frame()
+			if frame:
+				send_frame(process_frame(frame))
+except CaptureFinished, ex:
+	print metrics.summary()
+	print "Stopping at %s." % ex
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+
+# Script to check the X capture backends against a headless X server.
+# It starts Xvfb (or uses the display given), paints known colours on
+# the root window, and checks that each backend captures them, and that
+# XDamage reports the painting near the edges of the screen.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import ctypes
+import os
+import subprocess
+import sys
+import time
+
+from backlight import xlib
+from backlight.capture import GtkCapture, GtkEdgeCapture, XShmCapture
+from backlight.configuration import DEFAULTS
+from backlight.damage import DamageWatcher, watched_areas
+from backlight.video import parse_size
+
+RED = 0xFF0000
+BLUE = 0x0000FF
+
+def start_xvfb(name, size):
+	"""
+	Start Xvfb on the display name, and wait until it takes connections.
+	"""
+	try:
+		server = subprocess.Popen(['Xvfb', name, '-screen', '0', '%dx%dx24' % size, '-nolisten', 'tcp'])
+	except OSError, ex:
+		sys.exit("Unable to start Xvfb (%s); is it installed?" % ex)
+
+	for attempt in range(50):
+		if server.poll() is not None:
+			sys.exit("Xvfb stopped straight away, with status %d." % server.returncode)
+		try:
+			xlib.Display(name).close()
+			return server
+		except xlib.XError:
+			time.sleep(0.1)
+
+	server.terminate()
+	sys.exit("Xvfb didn't start taking connections.")
+
+class Painter(object):
+	"""
+	Fills rectangles of the root window with solid colours, given as
+	0xRRGGBB, which is what the pixel values are at 24 bits.
+	"""
+
+	def __init__(self):
+		self.display = xlib.Display()
+		x11 = self.display.x11
+		xlib.declare(x11.XCreateGC, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_ulong, ctypes.c_ulong, ctypes.c_void_p)
+		xlib.declare(x11.XFreeGC, ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p)
+		xlib.declare(x11.XSetForeground, ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_ulong)
+		xlib.declare(x11.XFillRectangle, ctypes.c_int,
+			ctypes.c_void_p, ctypes.c_ulong, ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.c_uint, ctypes.c_uint)
+		self.gc = x11.XCreateGC(self.display.display, self.display.root, 0, None)
+		self.size = self.display.size
+
+	def fill(self, colour, x, y, width, height):
+		x11 = self.display.x11
+		x11.XSetForeground(self.display.display, self.gc, colour)
+		x11.XFillRectangle(self.display.display, self.display.root, self.gc, x, y, width, height)
+		x11.XSync(self.display.display, 0)
+
+	def quarters(self):
+		"""
+		Paint the screen black, with the top left quarter red and the bottom
+		right quarter blue.
+		"""
+		width, height = self.size
+		self.fill(0, 0, 0, width, height)
+		self.fill(RED, 0, 0, width // 2, height // 2)
+		self.fill(BLUE, width // 2, height // 2, width - (width // 2), height - (height // 2))
+
+	def close(self):
+		self.display.x11.XFreeGC(self.display.display, self.gc)
+		self.display.close()
+
+def rgb(colour):
+	return [(colour >> 16) & 0xFF, (colour >> 8) & 0xFF, colour & 0xFF]
+
+def check_capture(painter, backend, settings):
+	"""
+	Capture the painted quarters with the backend, and return a list of
+	what came out wrong.
+	"""
+	configuration = dict(DEFAULTS)
+	configuration.update({'size_x': 16, 'size_y': 10})
+	configuration.update(settings)
+
+	capture = backend(configuration)
+	try:
+		capture.capture()
+		scaled = capture.scale()
+	finally:
+		capture.close()
+
+	# What each corner of the scaled down screen should be.
+	if configuration['region']:
+		expected = [((0, 0), BLUE), ((-1, -1), BLUE)]
+	else:
+		expected = [((0, 0), RED), ((-1, -1), BLUE), ((0, -1), 0), ((-1, 0), 0)]
+
+	problems = []
+	for (row, column), colour in expected:
+		got = [int(value) for value in scaled[row, column]]
+		if got != rgb(colour):
+			problems.append("pixel %d, %d is %s rather than %s" % (row, column, got, rgb(colour)))
+	return problems
+
+class ReportingWatcher(DamageWatcher):
+	"""
+	A DamageWatcher that keeps the damaged rectangles it's told about.
+	"""
+
+	def __init__(self, *args):
+		self.reported = []
+		DamageWatcher.__init__(self, *args)
+
+	def touches(self, x, y, width, height):
+		self.reported.append((x, y, width, height))
+		return DamageWatcher.touches(self, x, y, width, height)
+
+def check_damage(painter):
+	"""
+	Paint the middle of the screen, which shouldn't wake the watcher,
+	and then near the top left corner, which should, and return a list
+	of what went wrong.
+	"""
+	width, height = painter.size
+	watcher = ReportingWatcher(watched_areas(painter.size, 16, 10, 1, 1), 1, 1.0)
+	problems = []
+	try:
+		# The first frame is captured regardless.
+		watcher.wait()
+
+		painter.fill(RED, (width // 2) - 10, (height // 2) - 10, 20, 20)
+		start = time.time()
+		keepalive = watcher.wait()
+		took = time.time() - start
+		if not keepalive or took < 0.9:
+			problems.append("damage in the middle of the screen woke it after %0.2fs" % took)
+
+		painter.fill(BLUE, 10, 10, 20, 20)
+		start = time.time()
+		keepalive = watcher.wait()
+		took = time.time() - start
+		if keepalive or took > 0.5:
+			problems.append("damage at the edge took %0.2fs to wake it" % took)
+
+		for x, y, w, h in [((width // 2) - 10, (height // 2) - 10, 20, 20), (10, 10, 20, 20)]:
+			if not any(x < rx + rw and rx < x + w and y < ry + rh and ry < y + h for rx, ry, rw, rh in watcher.reported):
+				problems.append("the damage at %d, %d wasn't reported (got %s)" % (x, y, watcher.reported))
+	finally:
+		watcher.close()
+	return problems
+
+def main():
+	parser = argparse.ArgumentParser(description = "Check the X capture backends against a headless X server.")
+	parser.add_argument('--display', help = "Use this X display rather than starting Xvfb.")
+	parser.add_argument('--xvfb-display', default = ':99', help = "The display number to start Xvfb on.")
+	parser.add_argument('--size', default = '1280x720', type = parse_size, help = "The size of the Xvfb screen.")
+	options = parser.parse_args()
+
+	server = None
+	if options.display:
+		os.environ['DISPLAY'] = options.display
+	else:
+		server = start_xvfb(options.xvfb_display, options.size)
+		os.environ['DISPLAY'] = options.xvfb_display
+
+	failed = False
+	try:
+		try:
+			painter = Painter()
+		except xlib.XError, ex:
+			sys.exit("Unable to draw on %s: %s." % (os.environ['DISPLAY'], ex))
+		painter.quarters()
+		width, height = painter.size
+		region = [width // 2, height // 2, width - (width // 2), height - (height // 2)]
+
+		# Each check is a name, a function and its arguments after the painter.
+		# The XDamage check paints over the quarters, so it goes last.
+		checks = [
+			("MIT-SHM", check_capture, XShmCapture, {}),
+			("MIT-SHM, zones", check_capture, XShmCapture, {'zone_depth': 4}),
+			("MIT-SHM, region", check_capture, XShmCapture, {'region': region}),
+			("GTK", check_capture, GtkCapture, {}),
+			("GTK, region", check_capture, GtkCapture, {'region': region}),
+			("GTK edges", check_capture, GtkEdgeCapture, {}),
+			("XDamage", check_damage),
+		]
+		for check in checks:
+			name, function, args = check[0], check[1], check[2:]
+			try:
+				problems = function(painter, *args)
+			except ImportError, ex:
+				print "%s: skipped (%s)." % (name, ex)
+				continue
+			except Exception, ex:
+				problems = ["%s: %s" % (ex.__class__.__name__, ex)]
+
+			if problems:
+				failed = True
+				print "%s: FAILED, %s." % (name, '; '.join(problems))
+			else:
+				print "%s: ok." % name
+
+		painter.close()
+	finally:
+		if server:
+			server.terminate()
+			server.wait()
+
+	if failed:
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+
+# Script to stand in for the TVBacklight sketch, for testing the capture
+# scripts without an Arduino. It does what the sketch does with each
+# packet, and reports how the frames arrived.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import json
+import os
+import socket
+import struct
+import time
+import zlib
+
+from backlight import protocol
+from backlight.emulator import SketchEmulator
+from backlight.metrics import Histogram
+
+# Darkest to brightest, for the ASCII dump.
+ASCII_RAMP = ' .:-=+*#%@'
+
+class ReceiveStats(object):
+	"""
+	Counts the packets and frames as they arrive. The timings are kept
+	until the next summary.
+	"""
+
+	def __init__(self):
+		self.packets = 0
+		self.bytes = 0
+		self.rejected = 0
+		self.types = {}
+		self.frames = 0
+		self.dropped = 0
+		self.reordered = 0
+
+		# The last packet number from each sender, and the jitter as RFC 3550
+		# works it out, from the difference in transit times.
+		self.numbers = {}
+		self.last_transit = None
+		self.jitter = 0.0
+
+		self.reset()
+
+	def reset(self):
+		self.started = time.time()
+		self.window_frames = 0
+		self.last_frame = None
+		self.intervals = Histogram()
+		self.latency = Histogram()
+
+	def packet(self, packet, address, received, max_size):
+		self.packets += 1
+		self.bytes += len(packet)
+		if len(packet) > max_size:
+			self.rejected += 1
+		kind = packet[:1]
+		self.types[kind] = self.types.get(kind, 0) + 1
+
+		trailer = protocol.read_trailer(packet)
+		if trailer is None:
+			return
+		number, sent = trailer
+
+		last = self.numbers.get(address)
+		if last is not None:
+			gap = (number - last) & 0xFFFFFFFF
+			if gap == 0 or gap > 0x7FFFFFFF:
+				self.reordered += 1
+				return
+			self.dropped += gap - 1
+		self.numbers[address] = number
+
+		transit = received - sent
+		self.latency.record(transit)
+		if self.last_transit is not None:
+			self.jitter += (abs(transit - self.last_transit) - self.jitter) / 16
+		self.last_transit = transit
+
+	def frame(self, received):
+		self.frames += 1
+		self.window_frames += 1
+		if self.last_frame is not None:
+			self.intervals.record(received - self.last_frame)
+		self.last_frame = received
+
+	def summary(self):
+		now = time.time()
+		line = "Packets %d (%d bytes, %d too big), frames %d, FPS %0.2f" % (
+			self.packets,
+			self.bytes,
+			self.rejected,
+			self.frames,
+			self.window_frames / max(now - self.started, 0.0001)
+		)
+		intervals = self.intervals.percentiles()
+		if intervals[50] is not None:
+			line += ", interval p50/p99 %0.2fms/%0.2fms" % (intervals[50] * 1000, intervals[99] * 1000)
+		latency = self.latency.percentiles()
+		if latency[50] is not None:
+			line += ", latency p50/p95/p99 %0.2fms/%0.2fms/%0.2fms, jitter %0.2fms, dropped %d, reordered %d" % (
+				latency[50] * 1000,
+				latency[95] * 1000,
+				latency[99] * 1000,
+				self.jitter * 1000,
+				self.dropped,
+				self.reordered
+			)
+		self.reset()
+		return line + "."
+
+def ascii_dump(pixels, width = 75):
+	"""
+	Return the strip as lines of characters, with denser characters for
+	brighter pixels.
+	"""
+	levels = (pixels.astype(int).sum(axis = 1) * len(ASCII_RAMP)) // ((255 * 3) + 1)
+	text = ''.join(ASCII_RAMP[level] for level in levels.tolist())
+	return '\n'.join('|' + text[i:i + width] + '|' for i in range(0, len(text), width))
+
+def write_png(path, pixels, scale = 8):
+	"""
+	Save the strip as a PNG, scale pixels square per LED, in a row.
+	"""
+	row = pixels.repeat(scale, axis = 0).tobytes()
+	raw = ('\x00' + row) * scale
+
+	def chunk(kind, data):
+		return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+	with open(path, 'wb') as output:
+		output.write('\x89PNG\r\n\x1a\n')
+		output.write(chunk('IHDR', struct.pack('>IIBBBBB', len(pixels) * scale, scale, 8, 2, 0, 0, 0)))
+		output.write(chunk('IDAT', zlib.compress(raw)))
+		output.write(chunk('IEND', ''))
+
+def main():
+	# Listen where the capture scripts send, if there's a config.json.
+	port = 8888
+	if os.path.exists('config.json'):
+		port = json.loads(open('config.json').read()).get('port', port)
+
+	parser = argparse.ArgumentParser(description = "Pretend to be the TVBacklight sketch.")
+	parser.add_argument('--bind', default = '127.0.0.1', help = "Address to listen on.")
+	parser.add_argument('--port', default = port, type = int)
+	parser.add_argument('--pixels', default = 150, type = int, help = "STRIP_PIXELS in the sketch.")
+	parser.add_argument('--input', default = 0, type = int, help = "Start on this input, as if it had been switched to.")
+	parser.add_argument('--max-size', default = protocol.PACKET_MAX_SIZE, type = int, help = "PACKET_MAX_SIZE in the sketch.")
+	parser.add_argument('--truncate', action = 'store_true',
+		help = "Cut packets bigger than --max-size (timestamp trailer and all) off, as the sketch does, rather than ignoring them.")
+	parser.add_argument('--summary', default = 5, type = float, help = "Print a summary every this many seconds.")
+	parser.add_argument('--duration', type = float, help = "Stop after this many seconds.")
+	parser.add_argument('--record', help = "Append each frame shown to this file, as a double receive time and then the RGB pixels.")
+	parser.add_argument('--png', help = "Save the strip as a PNG to this file with each summary.")
+	parser.add_argument('--ascii', action = 'store_true', help = "Print the strip as text with each summary.")
+	options = parser.parse_args()
+
+	receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+	receiver.bind((options.bind, options.port))
+	receiver.settimeout(0.1)
+	print "Emulating a %d pixel strip on %s:%d." % (options.pixels, options.bind, options.port)
+
+	emulator = SketchEmulator(options.pixels, options.max_size)
+	emulator.input = options.input
+	stats = ReceiveStats()
+	record = open(options.record, 'ab') if options.record else None
+	started = time.time()
+	last_summary = started
+
+	def report():
+		print stats.summary()
+		if options.ascii:
+			print ascii_dump(emulator.shown)
+		if options.png:
+			write_png(options.png, emulator.shown)
+
+	try:
+		while options.duration is None or time.time() - started < options.duration:
+			try:
+				packet, address = receiver.recvfrom(65536)
+				received = time.time()
+			except socket.timeout:
+				packet = None
+				received = time.time()
+
+			if packet is not None:
+				stats.packet(packet, address, received, options.max_size)
+				# Packets that are too big don't get to the sketch whole, so
+				# make that obvious on the strip, rather than just counting them.
+				if len(packet) > options.max_size and not options.truncate:
+					packet = ''
+				for show in range(emulator.receive(packet)):
+					stats.frame(received)
+					if record:
+						record.write(struct.pack('<d', received))
+						record.write(emulator.shown.tobytes())
+
+			if received - last_summary >= options.summary:
+				report()
+				last_summary = received
+	except KeyboardInterrupt:
+		pass
+
+	report()
+	print "Packets by type: %s. Fragmented frames shown incomplete: %d." % (
+		', '.join("%s %d" % (kind, count) for kind, count in sorted(stats.types.items())),
+		emulator.incomplete_frames
+	)
+	if record:
+		record.close()
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+# Script to replay a recording of the packets sent by the capture
+# scripts (see record_file in config.json) to a controller, or to
+# emulate-sketch.py, with the same timing or sped up.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import json
+import os
+import socket
+import time
+
+from backlight import protocol
+from backlight.recording import Recording
+
+def describe(recording):
+	"""
+	Print what's in the recording. This reads the first byte of every
+	packet, but nothing else.
+	"""
+	types = {}
+	size = 0
+	for when, packet in recording.packets():
+		types[packet[:1]] = types.get(packet[:1], 0) + 1
+		size += len(packet)
+
+	print "Recorded %s: %d packets (%d bytes) over %0.2fs." % (
+		time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(recording.started)),
+		len(recording),
+		size,
+		recording.duration
+	)
+	print "Packets by type: %s." % ', '.join("%s %d" % (kind, count) for kind, count in sorted(types.items()))
+
+def restamp(packet):
+	"""
+	Replace the send time in the packet's trailer (if it has one) with
+	now, so the receiver's latency figures mean something.
+	"""
+	trailer = protocol.read_trailer(packet)
+	if trailer is None:
+		return packet
+	return packet[:-protocol.TRAILER.size] + protocol.TRAILER.pack(protocol.TRAILER_MAGIC, trailer[0], time.time())
+
+def main():
+	# Send where the capture scripts send, if there's a config.json.
+	host = '127.0.0.1'
+	port = 8888
+	if os.path.exists('config.json'):
+		settings = json.loads(open('config.json').read())
+		host = settings.get('host', host)
+		port = settings.get('port', port)
+
+	parser = argparse.ArgumentParser(description = "Replay a recording of the packets sent to the controller.")
+	parser.add_argument('recording')
+	parser.add_argument('--host', default = host)
+	parser.add_argument('--port', default = port, type = int)
+	parser.add_argument('--speed', default = 1.0, type = float,
+		help = "Replay this many times faster than it was recorded. 0 sends as fast as possible, to load test the receiver.")
+	parser.add_argument('--start', default = 0.0, type = float, help = "Start this many seconds into the recording.")
+	parser.add_argument('--restamp', action = 'store_true',
+		help = "Put the time each packet is replayed in its send_timestamps trailer, rather than the time it was recorded.")
+	parser.add_argument('--info', action = 'store_true', help = "Describe the recording, rather than replaying it.")
+	options = parser.parse_args()
+
+	recording = Recording(options.recording)
+	if options.info:
+		describe(recording)
+		return
+
+	sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	address = (options.host, options.port)
+	print "Replaying %d packets over %0.2fs to %s:%d." % (len(recording), recording.duration, options.host, options.port)
+
+	sent = 0
+	size = 0
+	errors = 0
+	latest = 0.0
+	started = time.time()
+	first = None
+
+	try:
+		for when, packet in recording.packets(options.start):
+			if first is None:
+				first = when
+
+			# Wait until it's due. If we're behind, send straight away, and
+			# keep track of how far behind we got.
+			if options.speed:
+				delay = started + ((when - first) / options.speed) - time.time()
+				if delay > 0:
+					time.sleep(delay)
+				else:
+					latest = max(latest, -delay)
+
+			if options.restamp:
+				packet = restamp(packet)
+			try:
+				sender.sendto(packet, address)
+			except socket.error:
+				errors += 1
+			sent += 1
+			size += len(packet)
+	except KeyboardInterrupt:
+		pass
+
+	elapsed = time.time() - started
+	print "Sent %d packets (%d bytes) in %0.2fs, %0.1f packets a second. Send errors %d, latest packet %0.2fms late." % (
+		sent,
+		size,
+		elapsed,
+		sent / max(elapsed, 0.0001),
+		errors,
+		latest * 1000
+	)
+	recording.close()
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+# Script to send a command to the running capture script, over its
+# control socket.
+#
+# Copyright 2013 Daniel Foote.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import sys
+
+from backlight import control
+
+USAGE = """Usage: %s <command>
+
+Commands:
+  input <input number> [<colour>]  Switch input.
+  colour <colour>                  Pause, and fill the strip with a colour.
+  pixels <colour> [<colour> ...]   Pause, and repeat the colours along the strip.
+  pause                            Stop sending.
+  resume                           Start sending again.
+  reload                           Reload config.json.
+  stats                            Print the timings and counts.
+
+Colours are in hex, like FF8000."""
+
+if len(sys.argv) < 2:
+	print USAGE % sys.argv[0]
+	sys.exit()
+
+# Load the configuration.
+if not os.path.exists('config.json'):
+	print "No config.json found - please create and try again."
+	sys.exit()
+
+configuration = json.loads(open('config.json').read())
+
+if __name__ == '__main__':
+	command = sys.argv[1]
+	arguments = {}
+	try:
+		if command == 'input':
+			arguments['input'] = int(sys.argv[2])
+			if len(sys.argv) > 3: arguments['colour'] = sys.argv[3]
+		elif command == 'colour':
+			arguments['colour'] = sys.argv[2]
+		elif command == 'pixels':
+			arguments['colours'] = sys.argv[2:]
+	except (IndexError, ValueError):
+		print USAGE % sys.argv[0]
+		sys.exit(1)
+
+	client = control.connect(configuration)
+	if not client:
+		print "The capture script isn't running, or control_socket isn't set in config.json."
+		sys.exit(1)
+
+	try:
+		reply = client.command(command, **arguments)
+	except control.ControlError, ex:
+		print "Failed: %s" % ex
+		sys.exit(1)
+	finally:
+		client.close()
+
+	del reply['ok']
+	if reply:
+		print json.dumps(reply, indent = 1, sort_keys = True)
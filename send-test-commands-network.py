@@ -18,6 +18,10 @@
 
 import socket
 import struct
+import os
+import json
+
+from backlight import control
 
 UDP_IP = "10.0.14.200"
 UDP_PORT = 8888
@@ -45,13 +49,26 @@ def send_message(host, port, message):
 
 if __name__ == '__main__':
 
-	total = 150
-	send_message(UDP_IP, UDP_PORT, change_input(1, 0x000000))
+	# If the capture script is running, have it send the test pattern, as
+	# otherwise it would just draw over it. It stays paused until resumed
+	# with send-command.py.
+	configuration = {}
+	if os.path.exists('config.json'):
+		configuration = json.loads(open('config.json').read())
+	client = control.connect(configuration)
+	if client:
+		client.command('input', input = 1, colour = 0x000000)
+		client.command('pixels', colours = [0xFF0000, 0x00FF00, 0x0000FF])
+		client.close()
+		print "The capture script is paused. Resume it with: send-command.py resume"
+	else:
+		total = 150
+		send_message(UDP_IP, UDP_PORT, change_input(1, 0x000000))
 
-	message = send_pixel_header(1, total)
-	for i in range(total / 3):
-		message += send_pixel(0xFF0000)
-		message += send_pixel(0x00FF00)
-		message += send_pixel(0x0000FF)
+		message = send_pixel_header(1, total)
+		for i in range(total / 3):
+			message += send_pixel(0xFF0000)
+			message += send_pixel(0x00FF00)
+			message += send_pixel(0x0000FF)
 
-	send_message(UDP_IP, UDP_PORT, message)
+		send_message(UDP_IP, UDP_PORT, message)
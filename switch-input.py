@@ -17,11 +17,13 @@
 # limitations under the License.
 
 import socket
-import struct
 import os
 import json
 import sys
 
+from backlight import control
+from backlight.protocol import input_packet
+
 if len(sys.argv) < 2:
 	print "Usage: %s <input number> [<default colour>]" % sys.argv[0]
 	sys.exit()
@@ -34,11 +36,7 @@ if not os.path.exists('config.json'):
 configuration = json.loads(open('config.json').read())
 
 def change_input(inp, colour):
-	message = ''
-	message += 'I'
-	message += struct.pack('<B', inp)
-	message += struct.pack('<I', colour)
-	return message
+	return input_packet(inp, colour)
 
 def send_message(host, port, message):
 	sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -46,5 +44,13 @@ def send_message(host, port, message):
 
 if __name__ == '__main__':
 	colour = 0x00000000
-        if len(sys.argv) == 3: colour = int(sys.argv[2], 16)
-	send_message(configuration['host'], configuration['port'], change_input(int(sys.argv[1]), colour))
+	if len(sys.argv) == 3: colour = int(sys.argv[2], 16)
+
+	# If the capture script is running, have it switch, so that it sends its
+	# pixels to the new input too. Otherwise, tell the controller directly.
+	client = control.connect(configuration)
+	if client:
+		client.command('input', input = int(sys.argv[1]), colour = colour)
+		client.close()
+	else:
+		send_message(configuration['host'], configuration['port'], change_input(int(sys.argv[1]), colour))